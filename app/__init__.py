@@ -1,24 +1,98 @@
 from os import environ
-from flask import Flask, jsonify, redirect
+from flask import Flask, abort, jsonify, redirect
 from app.user import user
 from app.bookmarks import bookmarks
+from app.monitoring import monitoring
 from app.database import db
+from app.cache import short_url_cache
+from app.singleflight import SingleFlightTimeout, short_url_lookups
+from app.visits import downsample_visits_command, visit_counter
+from app.shortcodes import short_codes
+from app.codefilter import short_code_filter
+from app.queryplans import check_query_plans
+from app import serializers
+from app.passwords import passwords
+from app import identity
+from app import schema
+from app.engine import dispose_after_fork, engine_options
+from app.replicas import read_replica, replica_router
+from app.metrics import metrics
 from flask_jwt_extended import JWTManager
+from app.synthetic import generate_data
 from app.database import Bookmark
 from http import HTTPStatus
-from flasgger import Swagger
-from app.config.swagger import template, swagger_config
+from app.config.swagger import init_swagger, DEFAULT_SPEC_PATH
+
+def _env_flag(name, default=False):
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
 
 def create_app(test_config=None):
     app = Flask(__name__,
         instance_relative_config=True)
 
     if test_config is None:
+        # the production profile leaves the schema to the migrations and
+        # serves the pre-rendered api spec
+        production = environ.get('STARTUP_PROFILE', 'development') == 'production'
+
         app.config.from_mapping(
             SECRET_KEY=environ.get('SECRET_KEY'),
             SQLALCHEMY_DATABASE_URI=environ.get("SQLALCHEMY_DATABASE_URI"),
             SQLALCHEMY_TRACK_MODIFICATIONS=False,
+            DATABASE_POOL_SIZE=int(environ.get('DATABASE_POOL_SIZE', 5)),
+            DATABASE_MAX_OVERFLOW=int(environ.get('DATABASE_MAX_OVERFLOW', 10)),
+            DATABASE_POOL_TIMEOUT=float(environ.get('DATABASE_POOL_TIMEOUT', 30)),
+            DATABASE_POOL_RECYCLE=int(environ.get('DATABASE_POOL_RECYCLE', 1800)),
+            DATABASE_POOL_PRE_PING=_env_flag('DATABASE_POOL_PRE_PING', True),
+            DATABASE_STATEMENT_TIMEOUT=int(environ.get('DATABASE_STATEMENT_TIMEOUT', 0)),
+            DATABASE_PGBOUNCER=_env_flag('DATABASE_PGBOUNCER'),
+            DATABASE_REPLICA_URIS=[uri for uri in environ.get('DATABASE_REPLICA_URIS', '').split(',') if uri],
+            REPLICA_STICKY_SIZE=int(environ.get('REPLICA_STICKY_SIZE', 10000)),
+            REPLICA_STICKY_TTL=int(environ.get('REPLICA_STICKY_TTL', 5)),
+            REPLICA_HEALTH_INTERVAL=float(environ.get('REPLICA_HEALTH_INTERVAL', 10)),
+            REPLICA_MAX_LAG=float(environ.get('REPLICA_MAX_LAG', 30)),
             JWT_SECRET_KEY=environ.get('JWT_SECRET_KEY'),
+            MAX_PER_PAGE=int(environ.get('MAX_PER_PAGE', 100)),
+            BOOKMARK_DEDUPE_SCOPE=environ.get('BOOKMARK_DEDUPE_SCOPE', 'global'),
+            IMPORT_CHUNK_SIZE=int(environ.get('IMPORT_CHUNK_SIZE', 500)),
+            EXPORT_BATCH_SIZE=int(environ.get('EXPORT_BATCH_SIZE', 1000)),
+            BATCH_MAX_SIZE=int(environ.get('BATCH_MAX_SIZE', 1000)),
+            JSON_BACKEND=environ.get('JSON_BACKEND', 'auto'),
+            JSON_DATETIME_FORMAT=environ.get('JSON_DATETIME_FORMAT', 'http'),
+            PASSWORD_HASH_METHOD=environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+            PASSWORD_HASH_ITERATIONS=int(environ.get('PASSWORD_HASH_ITERATIONS', 260000)),
+            PASSWORD_HASH_WORKERS=int(environ.get('PASSWORD_HASH_WORKERS', 0)),
+            PASSWORD_HASH_EXECUTOR=environ.get('PASSWORD_HASH_EXECUTOR', 'thread'),
+            PASSWORD_HASH_MAX_PENDING=int(environ.get('PASSWORD_HASH_MAX_PENDING', 32)),
+            PASSWORD_HASH_TIMEOUT=float(environ.get('PASSWORD_HASH_TIMEOUT', 0)),
+            JWT_IDENTITY_CLAIMS=_env_flag('JWT_IDENTITY_CLAIMS', True),
+            IDENTITY_CACHE_SIZE=int(environ.get('IDENTITY_CACHE_SIZE', 10000)),
+            IDENTITY_CACHE_TTL=int(environ.get('IDENTITY_CACHE_TTL', 60)),
+            SHORT_URL_CACHE_SIZE=int(environ.get('SHORT_URL_CACHE_SIZE', 10000)),
+            SHORT_URL_CACHE_TTL=int(environ.get('SHORT_URL_CACHE_TTL', 300)),
+            SHORT_URL_LOOKUP_TIMEOUT=float(environ.get('SHORT_URL_LOOKUP_TIMEOUT', 5.0)),
+            SHORT_CODE_ALLOCATOR=environ.get('SHORT_CODE_ALLOCATOR', 'block'),
+            SHORT_CODE_LENGTH=int(environ.get('SHORT_CODE_LENGTH', 5)),
+            SHORT_CODE_BLOCK_SIZE=int(environ.get('SHORT_CODE_BLOCK_SIZE', 100)),
+            SHORT_CODE_KEY=int(environ.get('SHORT_CODE_KEY', 0)),
+            SHORT_CODE_FILTER_ENABLED=_env_flag('SHORT_CODE_FILTER_ENABLED', True),
+            SHORT_CODE_FILTER_ERROR_RATE=float(environ.get('SHORT_CODE_FILTER_ERROR_RATE', 0.01)),
+            SHORT_CODE_FILTER_REFRESH_INTERVAL=float(environ.get('SHORT_CODE_FILTER_REFRESH_INTERVAL', 1.0)),
+            VISIT_FLUSH_INTERVAL=float(environ.get('VISIT_FLUSH_INTERVAL', 5.0)),
+            VISIT_FLUSH_THRESHOLD=int(environ.get('VISIT_FLUSH_THRESHOLD', 1000)),
+            VISIT_COUNTER_SYNC=_env_flag('VISIT_COUNTER_SYNC'),
+            VISIT_FLUSH_MAX_FAILURES=int(environ.get('VISIT_FLUSH_MAX_FAILURES', 5)),
+            VISIT_HOURLY_RETENTION_DAYS=int(environ.get('VISIT_HOURLY_RETENTION_DAYS', 30)),
+            VISITS_MAX_BUCKETS=int(environ.get('VISITS_MAX_BUCKETS', 1000)),
+            METRICS_ENABLED=_env_flag('METRICS_ENABLED', True),
+            SLOW_REQUEST_MS=float(environ.get('SLOW_REQUEST_MS', 1000)),
+            SLOW_QUERY_MS=float(environ.get('SLOW_QUERY_MS', 250)),
+            CREATE_SCHEMA_ON_STARTUP=_env_flag('CREATE_SCHEMA_ON_STARTUP', not production),
+            SWAGGER_MODE=environ.get('SWAGGER_MODE', 'static' if production else 'ui'),
+            SWAGGER_SPEC_PATH=environ.get('SWAGGER_SPEC_PATH', DEFAULT_SPEC_PATH),
             SWAGGER={
                 'title':"Bookmarks API",
                 'uiversion': 3
@@ -27,18 +101,42 @@ def create_app(test_config=None):
     else:
         app.config.from_mapping(test_config)
 
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+    replica_router.init_app(app)
+
     db.app=app
     db.init_app(app)
-    db.create_all(app=app)
+    dispose_after_fork(app)
+    schema.init_app(app)
+    if app.config.get('CREATE_SCHEMA_ON_STARTUP', True):
+        # only the primary, the replicas get the schema by replication
+        db.create_all(bind=None, app=app)
+
+    serializers.init_app(app)
+    passwords.init_app(app)
+    short_codes.init_app(app)
+    short_code_filter.init_app(app)
+    short_url_cache.init_app(app)
+    short_url_lookups.init_app(app)
+    visit_counter.init_app(app)
+    metrics.init_app(app)
 
-    JWTManager(app)
+    jwt = JWTManager(app)
+    identity.init_app(app, jwt)
 
     app.register_blueprint(user)
     app.register_blueprint(bookmarks)
+    app.register_blueprint(monitoring)
 
-    Swagger(app, config=swagger_config, template=template)
+    app.cli.add_command(check_query_plans)
+    app.cli.add_command(generate_data)
+    app.cli.add_command(downsample_visits_command)
+
+    init_swagger(app)
 
     @app.get('/<short_url>')
+    @read_replica
     def redirect_to_url(short_url):
         """
         Redirects to the bookmarked URL using the short url stored in the system
@@ -57,14 +155,38 @@ def create_app(test_config=None):
 
             404:
                 description: Bookmark was not found   
+
+            503:
+                description: The lookup of the short url timed out
         """
-        bookmark = Bookmark.query.filter_by(short_url=short_url).first_or_404()
+        cached = short_url_cache.get(short_url)
+
+        if cached is None:
+            # scanners and unknown codes are answered without a query
+            if not short_code_filter.might_exist(short_url):
+                abort(HTTPStatus.NOT_FOUND)
+
+            def lookup():
+                bookmark = db.session.query(Bookmark.id, Bookmark.url).filter_by(
+                    short_url=short_url).first()
+                if bookmark is None:
+                    return None
+                short_url_cache.set(short_url, tuple(bookmark))
+                return tuple(bookmark)
+
+            # concurrent misses for the same code share one query
+            try:
+                cached = short_url_lookups.do(short_url, lookup)
+            except SingleFlightTimeout:
+                return (jsonify({'error': "Lookup timed out, please try again"}),
+                        HTTPStatus.SERVICE_UNAVAILABLE)
+            if cached is None:
+                abort(HTTPStatus.NOT_FOUND)
 
-        if bookmark:
-            bookmark.visits = bookmark.visits+1
-            db.session.commit()
+        bookmark_id, url = cached
+        visit_counter.record(bookmark_id)
 
-        return redirect(bookmark.url)
+        return redirect(url)
 
     @app.errorhandler(HTTPStatus.NOT_FOUND)
     def handle_404(e):
@@ -1,13 +1,28 @@
+import json
 import validators
-from flask import Blueprint, jsonify, request
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from http import HTTPStatus
-from app.database import db, Bookmark
+from sqlalchemy import and_, case, func, or_, tuple_
+from app.database import db, Bookmark, DailyVisits, HourlyVisits
+from app.cache import short_url_cache
+from app.replicas import read_replica
+from app.etags import bump_collection_version, collection_version, make_etag, not_modified, with_etag
+from app.serializers import BOOKMARK_COLUMNS, bookmark_row, bookmark_rows, dumps, serialize_bookmark
+from app.shortcodes import short_codes
+from app.codefilter import short_code_filter
+from app.search import search_clauses, search_terms
+from app.urls import url_hash
+from app.visits import day_of, delete_visits, hour_of
+from app.streaming import StreamError, csv_lines, iter_json_array, iter_ndjson, ndjson_lines
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from flasgger import swag_from
 
 bookmarks = Blueprint("bookmarks", __name__, url_prefix="/api/v1/bookmarks")
 
 @bookmarks.route('/', methods=['GET', 'POST'])
+@read_replica
 @jwt_required()
 def handle_bookmark():
     """
@@ -52,42 +67,36 @@ def handle_bookmark():
                 'error': "no valid URL specified"
             }), HTTPStatus.BAD_REQUEST)
 
-        if Bookmark.query.filter_by(url=url).first():
+        if _existing_url_hashes([url_hash(url)], current_user):
             return (jsonify({
                 'error': "URL already exists"
             }), HTTPStatus.CONFLICT)
 
         bookmark = Bookmark(url,body,user_id=current_user)
         db.session.add(bookmark)
+        bump_collection_version(current_user)
         db.session.commit()
 
-        return (jsonify({
-            'id': bookmark.id,
-            'url': bookmark.url,
-            'short_url': bookmark.short_url,
-            'visit': bookmark.visits,
-            'body': bookmark.body,
-            'created_at': bookmark.created_at,
-            'updated_at': bookmark.updated_at,
-        }), HTTPStatus.CREATED)
+        return (jsonify(serialize_bookmark(bookmark)), HTTPStatus.CREATED)
     else:
+        etag = make_etag(current_user, collection_version(current_user),
+                         request.query_string.decode())
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        per_page = min(request.args.get('per_page', 5, type=int),
+                       current_app.config.get('MAX_PER_PAGE', 100))
+
+        if 'cursor' in request.args:
+            return with_etag(_list_bookmarks_after_cursor(current_user, per_page), etag)
+
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 5, type=int)
-
-        bookmarks = Bookmark.query.filter_by(
-            user_id=current_user).paginate(page=page, per_page=per_page)
-        data = []
-
-        for bookmark in bookmarks.items:
-            data.append({
-                'id' : bookmark.id,
-                'url': bookmark.url,
-                'short_url' : bookmark.short_url,
-                'visit': bookmark.visits,
-                'body': bookmark.body,
-                'created_at': bookmark.created_at,
-                'updated_at': bookmark.updated_at,
-            })
+
+        bookmarks = db.session.query(*BOOKMARK_COLUMNS).filter(
+            Bookmark.user_id == current_user).order_by(
+            Bookmark.created_at, Bookmark.id).paginate(page=page, per_page=per_page)
+        data = bookmark_rows(bookmarks.items)
 
         meta = {
             'page': bookmarks.page,
@@ -98,9 +107,58 @@ def handle_bookmark():
             'has_next': bookmarks.has_next,
             'has_prev': bookmarks.has_prev,
         }
-        return (jsonify({'data':data, 'meta':meta}), HTTPStatus.OK)
+        return with_etag((jsonify({'data':data, 'meta':meta}), HTTPStatus.OK), etag)
+
+def _encode_cursor(bookmark):
+    position = [bookmark.created_at.isoformat(), bookmark.id]
+    return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def _decode_cursor(cursor):
+    created_at, id = json.loads(urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), int(id)
+
+def _list_bookmarks_after_cursor(current_user, per_page):
+    """
+    Keyset pagination over (created_at, id). Instead of counting and
+    skipping rows every page continues right after the last row of the
+    previous one, which the (user_id, created_at, id) index serves
+    directly no matter how deep the page is.
+    """
+    per_page = max(per_page, 1)
+    query = db.session.query(*BOOKMARK_COLUMNS).filter(Bookmark.user_id == current_user)
+    cursor = request.args.get('cursor', '')
+
+    if cursor:
+        try:
+            position = _decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return (jsonify({
+                'error': "invalid cursor"
+            }), HTTPStatus.BAD_REQUEST)
+
+        query = query.filter(tuple_(Bookmark.created_at, Bookmark.id) > position)
+
+    # one extra row tells whether there is a next page without counting
+    items = query.order_by(
+        Bookmark.created_at, Bookmark.id).limit(per_page + 1).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+    data = bookmark_rows(items)
+
+    meta = {
+        'per_page': per_page,
+        'next_cursor': _encode_cursor(items[-1]) if has_next else None,
+        'has_next': has_next,
+        'total_count': None,
+    }
+
+    if request.args.get('total', 'false').lower() == 'true':
+        meta['total_count'] = Bookmark.query.filter_by(user_id=current_user).count()
+
+    return (jsonify({'data':data, 'meta':meta}), HTTPStatus.OK)
 
 @bookmarks.get("/<int:id>")
+@read_replica
 @jwt_required()
 def get_bookmark(id):
     """
@@ -124,20 +182,135 @@ def get_bookmark(id):
     """    
     current_user = get_jwt_identity()
 
-    bookmark = Bookmark.query.filter_by(
-                              user_id=current_user, id=id).first()
+    # visits don't touch updated_at, so they are part of the version
+    version = db.session.query(Bookmark.created_at, Bookmark.updated_at, Bookmark.visits).filter(
+        Bookmark.user_id == current_user, Bookmark.id == id).first()
 
-    if not bookmark:
+    if not version:
+        return (jsonify({'message': "Bookmark not found"}), HTTPStatus.NOT_FOUND)
+
+    etag = make_etag(id, *version)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    bookmark = db.session.query(*BOOKMARK_COLUMNS).filter(
+        Bookmark.user_id == current_user, Bookmark.id == id).first()
+
+    return with_etag((jsonify(bookmark_row(bookmark)), HTTPStatus.OK), etag)
+
+# bucket size, truncation and default range of the visit time series
+VISIT_BUCKETS = {
+    'hour': (timedelta(hours=1), hour_of, timedelta(days=7)),
+    'day': (timedelta(days=1), day_of, timedelta(days=90)),
+}
+
+def _utc(timestamp):
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+@bookmarks.get("/<int:id>/visits")
+@read_replica
+@jwt_required()
+def get_visits(id):
+    """
+    Bookmark visits over time
+    ---
+    tags:
+      - Bookmarks
+    description: >
+      Visits of a bookmark per UTC hour or day, read from the visit rollups.
+      Every bucket from from to to is returned, buckets without visits with
+      0. Hourly rollups older than VISIT_HOURLY_RETENTION_DAYS are only
+      available per day. Visits of the last VISIT_FLUSH_INTERVAL seconds may
+      be missing.
+    parameters:
+      - name: id
+        in: path
+        type: string
+        required: true
+      - name: from
+        in: query
+        type: string
+        format: date-time
+        description: ISO 8601 timestamp, defaults to 7 days (hour) or 90 days (day) before to
+      - name: to
+        in: query
+        type: string
+        format: date-time
+        description: ISO 8601 timestamp, defaults to now
+      - name: bucket
+        in: query
+        type: string
+        enum: [hour, day]
+        default: hour
+    responses:
+      200:
+        description: The visits per bucket
+      400:
+        description: Unknown bucket, invalid or too long time range
+      404:
+        description: Bookmark not found
+    security:
+      - Bearer: [] 
+    """
+    current_user = get_jwt_identity()
+    bucket = request.args.get('bucket', 'hour')
+
+    if bucket not in VISIT_BUCKETS:
+        return (jsonify({
+            'error': "bucket must be hour or day"
+        }), HTTPStatus.BAD_REQUEST)
+    size, truncate, default_range = VISIT_BUCKETS[bucket]
+
+    try:
+        end = _utc(request.args['to']) if 'to' in request.args else datetime.utcnow()
+        start = _utc(request.args['from']) if 'from' in request.args else end - default_range
+    except ValueError:
+        return (jsonify({
+            'error': "from and to must be ISO 8601 timestamps"
+        }), HTTPStatus.BAD_REQUEST)
+
+    start = truncate(start)
+    count = -((start - end) // size)
+    max_buckets = current_app.config.get('VISITS_MAX_BUCKETS', 1000)
+    if not 0 < count <= max_buckets:
+        return (jsonify({
+            'error': f"from must be before to and the range at most {max_buckets} buckets"
+        }), HTTPStatus.BAD_REQUEST)
+
+    if not db.session.query(Bookmark.id).filter(
+            Bookmark.user_id == current_user, Bookmark.id == id).first():
         return (jsonify({'message': "Bookmark not found"}), HTTPStatus.NOT_FOUND)
 
+    # at most one rollup row per hour or day, never one per visit
+    visits = Counter()
+    hourly = db.session.query(HourlyVisits.hour, HourlyVisits.visits).filter(
+        HourlyVisits.bookmark_id == id, HourlyVisits.hour >= start, HourlyVisits.hour < end)
+    for hour, hour_visits in hourly:
+        visits[truncate(hour)] += hour_visits
+
+    if bucket == 'day':
+        daily = db.session.query(DailyVisits.day, DailyVisits.visits).filter(
+            DailyVisits.bookmark_id == id, DailyVisits.day >= start, DailyVisits.day < end)
+        for day, day_visits in daily:
+            visits[day] += day_visits
+
+    buckets = [start + size * index for index in range(count)]
+
     return (jsonify({
-        'id': bookmark.id,
-        'url': bookmark.url,
-        'short_url': bookmark.short_url,
-        'visit': bookmark.visits,
-        'body': bookmark.body,
-        'created_at': bookmark.created_at,
-        'updated_at': bookmark.updated_at,     
+        'data': [{
+            'start': moment.isoformat(),
+            'visits': visits[moment],
+        } for moment in buckets],
+        'meta': {
+            'bucket': bucket,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'total': sum(visits.values()),
+        },
     }), HTTPStatus.OK)
 
 @bookmarks.put("/<int:id>")
@@ -192,18 +365,12 @@ def update_bookmark(id):
 
     bookmark.url = url
     bookmark.body = body
+    bump_collection_version(current_user)
 
     db.session.commit()
+    short_url_cache.invalidate(bookmark.short_url)
 
-    return (jsonify({
-            'id': bookmark.id,
-            'url': bookmark.url,
-            'short_url': bookmark.short_url,
-            'visit': bookmark.visits,
-            'body': bookmark.body,
-            'created_at': bookmark.created_at,
-            'updated_at': bookmark.updated_at,
-        }), HTTPStatus.OK)
+    return (jsonify(serialize_bookmark(bookmark)), HTTPStatus.OK)
 
 @bookmarks.delete("/<int:id>")
 @jwt_required()
@@ -231,12 +398,313 @@ def delete_bookmark(id):
     if not bookmark:
         return (jsonify({'message': "Bookmark not found"}), HTTPStatus.NOT_FOUND)
 
+    delete_visits([bookmark.id])
     db.session.delete(bookmark)
+    bump_collection_version(current_user)
     db.session.commit()
+    short_url_cache.invalidate(bookmark.short_url)
 
     return(jsonify({}), HTTPStatus.NO_CONTENT)
 
+BATCH_FILTERS = ('domain', 'created_before', 'max_visits')
+
+def _batch_targets(current_user, payload):
+    """
+    Ids and short urls of the current user's bookmarks selected by the ids
+    or the filter of a batch request, at most BATCH_MAX_SIZE of them. Returns
+    the rows and whether the filter matches more, or an error response.
+    """
+    max_size = current_app.config.get('BATCH_MAX_SIZE', 1000)
+    ids, criteria = payload.get('ids'), payload.get('filter')
+
+    if (ids is None) == (criteria is None):
+        return None, (jsonify({
+            'error': "specify either ids or filter"
+        }), HTTPStatus.BAD_REQUEST)
+
+    query = db.session.query(Bookmark.id, Bookmark.short_url).filter(
+        Bookmark.user_id == current_user)
+
+    if ids is not None:
+        # bool is an int subclass, true would select bookmark 1
+        if not isinstance(ids, list) or not all(
+                isinstance(id, int) and not isinstance(id, bool) for id in ids):
+            return None, (jsonify({
+                'error': "ids must be a list of integers"
+            }), HTTPStatus.BAD_REQUEST)
+        if len(ids) > max_size:
+            return None, (jsonify({
+                'error': f"at most {max_size} ids per request"
+            }), HTTPStatus.BAD_REQUEST)
+        query = query.filter(Bookmark.id.in_(ids))
+    else:
+        if not isinstance(criteria, dict) or not criteria or set(criteria) - set(BATCH_FILTERS):
+            return None, (jsonify({
+                'error': f"filter must have one or more of {', '.join(BATCH_FILTERS)}"
+            }), HTTPStatus.BAD_REQUEST)
+
+        try:
+            if 'domain' in criteria:
+                query = query.filter(_url_domain() == str(criteria['domain']).lower())
+            if 'created_before' in criteria:
+                query = query.filter(
+                    Bookmark.created_at < datetime.fromisoformat(criteria['created_before']))
+            if 'max_visits' in criteria:
+                query = query.filter(
+                    func.coalesce(Bookmark.visits, 0) <= int(criteria['max_visits']))
+        except (TypeError, ValueError):
+            return None, (jsonify({
+                'error': "created_before must be an ISO 8601 timestamp and max_visits an integer"
+            }), HTTPStatus.BAD_REQUEST)
+
+    # the rows stay locked until the statement of the batch commits
+    rows = query.order_by(Bookmark.id).limit(max_size + 1).with_for_update().all()
+    return (rows[:max_size], len(rows) > max_size), None
+
+def _batch_payload():
+    payload = request.get_json(silent=True)
+    return payload if isinstance(payload, dict) else None
+
+def _batch_response(rows, has_more):
+    ids = [id for id, short_url in rows]
+    return (jsonify({
+        'data': {'ids': ids},
+        'meta': {'count': len(ids), 'has_more': has_more},
+    }), HTTPStatus.OK)
+
+@bookmarks.patch("/")
+@jwt_required()
+def update_bookmarks():
+    """
+    Update many bookmarks
+    ---
+    tags:
+      - Bookmarks
+    description: >
+      Sets the body of the current user's bookmarks given by ids or a
+      filter with one UPDATE statement. A filter matches at most
+      BATCH_MAX_SIZE bookmarks per request, has_more tells whether to send
+      it again.
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          required:
+            - "body"
+          properties:
+            ids:
+              type: array
+              items:
+                type: integer
+              example: [1, 2, 3]
+            filter:
+              type: object
+              properties:
+                domain:
+                  type: string
+                  example: "google.com"
+                created_before:
+                  type: string
+                  format: date-time
+                max_visits:
+                  type: integer
+            body:
+              type: string
+              example: "Search engines"
+    responses:
+      200:
+        description: Ids of the updated bookmarks
+      400:
+        description: Invalid ids, filter or body
+    security:
+      - Bearer: [] 
+    """
+    current_user = get_jwt_identity()
+    payload = _batch_payload()
+
+    if payload is None:
+        return (jsonify({
+            'error': "request body must be a JSON object"
+        }), HTTPStatus.BAD_REQUEST)
+    if not isinstance(payload.get('body'), str):
+        return (jsonify({
+            'error': "body must be a string"
+        }), HTTPStatus.BAD_REQUEST)
+
+    targets, error = _batch_targets(current_user, payload)
+    if error is not None:
+        return error
+    rows, has_more = targets
+
+    if rows:
+        db.session.query(Bookmark).filter(
+            Bookmark.user_id == current_user, Bookmark.id.in_([id for id, _ in rows])
+        ).update({Bookmark.body: payload['body']}, synchronize_session=False)
+        bump_collection_version(current_user)
+    db.session.commit()
+
+    return _batch_response(rows, has_more)
+
+@bookmarks.delete("/")
+@jwt_required()
+def delete_bookmarks():
+    """
+    Delete many bookmarks
+    ---
+    tags:
+      - Bookmarks
+    description: >
+      Deletes the current user's bookmarks given by ids or a filter with
+      one DELETE statement. A filter matches at most BATCH_MAX_SIZE
+      bookmarks per request, has_more tells whether to send it again.
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            ids:
+              type: array
+              items:
+                type: integer
+              example: [1, 2, 3]
+            filter:
+              type: object
+              properties:
+                domain:
+                  type: string
+                  example: "google.com"
+                created_before:
+                  type: string
+                  format: date-time
+                max_visits:
+                  type: integer
+                  example: 0
+    responses:
+      200:
+        description: Ids of the deleted bookmarks
+      400:
+        description: Invalid ids or filter
+    security:
+      - Bearer: [] 
+    """
+    current_user = get_jwt_identity()
+
+    payload = _batch_payload()
+
+    if payload is None:
+        return (jsonify({
+            'error': "request body must be a JSON object"
+        }), HTTPStatus.BAD_REQUEST)
+
+    targets, error = _batch_targets(current_user, payload)
+    if error is not None:
+        return error
+    rows, has_more = targets
+
+    if rows:
+        ids = [id for id, _ in rows]
+        delete_visits(ids)
+        db.session.query(Bookmark).filter(
+            Bookmark.user_id == current_user, Bookmark.id.in_(ids)
+        ).delete(synchronize_session=False)
+        bump_collection_version(current_user)
+    db.session.commit()
+
+    for _, short_url in rows:
+        short_url_cache.invalidate(short_url)
+
+    return _batch_response(rows, has_more)
+
+@bookmarks.get("/search")
+@read_replica
+@jwt_required()
+def search_bookmarks():
+    """
+    Search bookmarks
+    ---
+    tags:
+      - Bookmarks
+    description: >
+      Full text search over the url and body of the current user's bookmarks,
+      best matches first. All words have to match, the last one also as a
+      prefix. Pages continue with the next_cursor of the previous page.
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: Words to search for
+      - name: per_page
+        in: query
+        type: integer
+      - name: cursor
+        in: query
+        type: string
+        description: next_cursor of the previous page
+    responses:
+      200:
+        description: Matching bookmarks and the cursor of the next page
+      400:
+        description: No search words or an invalid cursor
+    security:
+      - Bearer: []
+    """
+    current_user = get_jwt_identity()
+    terms = search_terms(request.args.get('q', ''))
+
+    if not terms:
+        return (jsonify({
+            'error': "no search words specified"
+        }), HTTPStatus.BAD_REQUEST)
+
+    per_page = max(min(request.args.get('per_page', 5, type=int),
+                       current_app.config.get('MAX_PER_PAGE', 100)), 1)
+
+    join, match, rank = search_clauses(db.engine.dialect.name, terms)
+    rank = rank.label('rank')
+    query = db.session.query(*BOOKMARK_COLUMNS, rank)
+    if join is not None:
+        query = query.join(*join)
+    query = query.filter(Bookmark.user_id == current_user, match)
+
+    cursor = request.args.get('cursor', '')
+    if cursor:
+        try:
+            last_rank, last_id = json.loads(urlsafe_b64decode(cursor.encode()))
+            last_rank, last_id = float(last_rank), int(last_id)
+        except (ValueError, TypeError):
+            return (jsonify({
+                'error': "invalid cursor"
+            }), HTTPStatus.BAD_REQUEST)
+
+        query = query.filter(or_(
+            rank.element < last_rank,
+            and_(rank.element == last_rank, Bookmark.id < last_id),
+        ))
+
+    # one extra row tells whether there is a next page without counting
+    items = query.order_by(rank.desc(), Bookmark.id.desc()).limit(per_page + 1).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+    data = bookmark_rows(item[:-1] for item in items)
+
+    next_cursor = None
+    if has_next:
+        position = [items[-1].rank, items[-1].id]
+        next_cursor = urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    return (jsonify({'data': data, 'meta': {
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'has_next': has_next,
+    }}), HTTPStatus.OK)
+
 @bookmarks.get("/stats")
+@read_replica
 @jwt_required()
 def get_stats():
     """
@@ -245,6 +713,20 @@ def get_stats():
     tags:
       - Bookmarks
     description: Statistics for all bookmarks of the current user
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        description: Number of bookmarks and domains to return
+      - name: order
+        in: query
+        type: string
+        enum: [desc, asc]
+        description: Return the most (desc) or least (asc) visited bookmarks
+      - name: full
+        in: query
+        type: boolean
+        description: Stream the visits of every bookmark instead of the top bookmarks
     responses:
       200:
         description: User successfully logged in
@@ -257,17 +739,315 @@ def get_stats():
     """
     current_user = get_jwt_identity()
 
-    data = []
+    if request.args.get('full', 'false').lower() == 'true':
+        return _stream_stats(current_user)
 
-    items = Bookmark.query.filter_by(user_id=current_user).all()
+    limit = max(min(request.args.get('limit', 10, type=int),
+                    current_app.config.get('MAX_PER_PAGE', 100)), 1)
+    order = request.args.get('order', 'desc')
 
-    for item in items:
-        new_link={
-            'visits': item.visits,
-            'url': item.url,
-            'id': item.id,
-            'short_url': item.short_url,
-        }
-        data.append(new_link)
+    if order not in ('asc', 'desc'):
+        return (jsonify({
+            'error': "order must be asc or desc"
+        }), HTTPStatus.BAD_REQUEST)
+
+    visits = func.coalesce(Bookmark.visits, 0)
+    visits_order = visits.desc() if order == 'desc' else visits.asc()
+
+    bookmark_count, visit_count, unvisited_count = db.session.query(
+        func.count(Bookmark.id),
+        func.coalesce(func.sum(visits), 0),
+        func.coalesce(func.sum(case((visits == 0, 1), else_=0)), 0),
+    ).filter(Bookmark.user_id == current_user).one()
+
+    top = db.session.query(
+        Bookmark.id, Bookmark.url, Bookmark.short_url, visits
+    ).filter(Bookmark.user_id == current_user).order_by(
+        visits_order, Bookmark.id).limit(limit)
+
+    domain = _url_domain()
+    domain_visits = func.sum(visits)
+    domains = db.session.query(
+        domain, func.count(Bookmark.id), domain_visits
+    ).filter(Bookmark.user_id == current_user).group_by(domain).order_by(
+        domain_visits.desc() if order == 'desc' else domain_visits.asc(),
+        domain).limit(limit)
+
+    return (jsonify({
+        'data': [{
+            'visits': visits,
+            'url': url,
+            'id': id,
+            'short_url': short_url,
+        } for id, url, short_url, visits in top],
+        'totals': {
+            'bookmarks': bookmark_count,
+            'visits': int(visit_count),
+            'unvisited': int(unvisited_count),
+        },
+        'domains': [{
+            'domain': domain,
+            'bookmarks': bookmarks,
+            'visits': int(visits or 0),
+        } for domain, bookmarks, visits in domains],
+    }), HTTPStatus.OK)
+
+def _url_domain():
+    """
+    SQL expression for the host part of Bookmark.url.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return func.lower(func.substring(Bookmark.url, '^[^:]+://([^/:?#]+)'))
+
+    # portable fallback that cuts the url after the scheme at the first slash
+    rest = func.substr(Bookmark.url, func.instr(Bookmark.url, '://') + 3)
+    return func.lower(case(
+        (func.instr(rest, '/') > 0, func.substr(rest, 1, func.instr(rest, '/') - 1)),
+        else_=rest))
+
+def _stream_stats(current_user):
+    """
+    Streams the visits of every bookmark of the user, reading the rows in
+    batches so the response never holds all of them in memory.
+    """
+    rows = db.session.query(
+        Bookmark.id, Bookmark.url, Bookmark.short_url, Bookmark.visits
+    ).filter(Bookmark.user_id == current_user).order_by(
+        Bookmark.id).yield_per(1000)
+
+    def generate():
+        yield '{"data": ['
+        separator = ''
+        for id, url, short_url, visits in rows:
+            yield separator + dumps({
+                'visits': visits,
+                'url': url,
+                'id': id,
+                'short_url': short_url,
+            })
+            separator = ', '
+        yield ']}'
+
+    return Response(stream_with_context(generate()), HTTPStatus.OK,
+                    mimetype='application/json')
+
+@bookmarks.post("/import")
+@jwt_required()
+def import_bookmarks():
+    """
+    Import bookmarks in bulk
+    ---
+    tags:
+      - Bookmarks
+    description: >
+      Imports a JSON array or a newline delimited JSON stream
+      (Content-Type application/x-ndjson) of bookmarks. The body is read and
+      processed in chunks and the response streams one result line per item.
+    consumes:
+      - application/json
+      - application/x-ndjson
+    produces:
+      - application/x-ndjson
+    parameters:
+      - name: body
+        description: Bookmarks with url and optional body
+        in: body
+        required: true
+        schema:
+          type: array
+          items:
+            type: object
+            required:
+              - "url"
+            properties:
+              body:
+                type: "String"
+                example: "Bookmark to the Google Website"
+              url:
+                type: "string"
+                example: "https://google.com"
+    responses:
+      200:
+        description: One result per imported item followed by a summary
+      401:
+        description: Incorrect credentials supplied
+    security:
+      - Bearer: [] 
+    """
+    current_user = get_jwt_identity()
+    chunk_size = current_app.config.get('IMPORT_CHUNK_SIZE', 500)
+
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = iter_ndjson(request.stream)
+    else:
+        items = iter_json_array(request.stream)
+
+    def generate():
+        summary = {'created': 0, 'duplicate': 0, 'invalid': 0}
+        chunk = []
+
+        try:
+            for index, (item, error) in enumerate(items):
+                chunk.append((index, item, error))
+                if len(chunk) >= chunk_size:
+                    yield from _import_chunk(chunk, current_user, summary)
+                    chunk = []
+            yield from _import_chunk(chunk, current_user, summary)
+        except StreamError as e:
+            yield from _import_chunk(chunk, current_user, summary)
+            summary['error'] = str(e)
+
+        yield dumps({'summary': summary}) + '\n'
+
+    return Response(stream_with_context(generate()), HTTPStatus.OK,
+                    mimetype='application/x-ndjson')
+
+def _import_chunk(chunk, current_user, summary):
+    """
+    Validates a chunk of import items, checks all of their urls for
+    duplicates with one query, allocates their short codes in one block and
+    inserts the new bookmarks with a single executemany.
+    """
+    results = []
+    candidates = {}
+
+    for index, item, error in chunk:
+        if error is None and not isinstance(item, dict):
+            error = "item is not an object"
+        url = item.get('url', '') if error is None else ''
+        body = item.get('body', '') if error is None else ''
+
+        if error is None and not (isinstance(url, str) and validators.url(url)):
+            error = "no valid URL specified"
+        if error is None and not isinstance(body, (str, type(None))):
+            error = "body is not a string"
+
+        if error is not None:
+            results.append({'index': index, 'status': 'invalid', 'error': error})
+        elif url_hash(url) in candidates:
+            results.append({'index': index, 'status': 'duplicate', 'url': url})
+        else:
+            candidates[url_hash(url)] = (index, url, body)
+
+    if candidates:
+        existing = _existing_url_hashes(candidates, current_user)
+        new = []
+
+        for hashed_url, (index, url, body) in candidates.items():
+            if hashed_url in existing:
+                results.append({'index': index, 'status': 'duplicate', 'url': url})
+            else:
+                new.append((hashed_url, index, url, body))
+
+        # one lease for the codes of the whole chunk
+        codes = short_codes.allocate_many(len(new)) if new else []
+        rows = []
+
+        for (hashed_url, index, url, body), code in zip(new, codes):
+            rows.append({
+                'url': url,
+                'url_hash': hashed_url,
+                'body': body,
+                'user_id': current_user,
+                'short_url': code,
+            })
+            results.append({'index': index, 'status': 'created',
+                            'url': url, 'short_url': code})
+
+        if rows:
+            db.session.execute(Bookmark.__table__.insert(), rows)
+            bump_collection_version(current_user)
+            db.session.commit()
+            # the core insert bypasses the ORM event that fills the filter
+            short_code_filter.add([row['short_url'] for row in rows])
+
+    for result in sorted(results, key=lambda result: result['index']):
+        summary[result['status']] += 1
+        yield dumps(result) + '\n'
+
+def _existing_url_hashes(url_hashes, current_user):
+    """
+    The url hashes that already have a bookmark, of any user or only of the
+    current one depending on ``BOOKMARK_DEDUPE_SCOPE``.
+    """
+    query = db.session.query(Bookmark.url_hash).filter(Bookmark.url_hash.in_(list(url_hashes)))
+    if current_app.config.get('BOOKMARK_DEDUPE_SCOPE', 'global') == 'user':
+        query = query.filter(Bookmark.user_id == current_user)
+    return {hashed_url for hashed_url, in query}
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
+
+@bookmarks.get("/export")
+@read_replica
+@jwt_required()
+def export_bookmarks():
+    """
+    Export bookmarks
+    ---
+    tags:
+      - Bookmarks
+    description: >
+      Streams all bookmarks of the current user as newline delimited JSON or
+      CSV. With updated_since only bookmarks created or changed since then
+      are exported.
+    produces:
+      - application/x-ndjson
+      - text/csv
+    parameters:
+      - name: format
+        in: query
+        type: string
+        enum: [ndjson, csv]
+        default: ndjson
+      - name: updated_since
+        in: query
+        type: string
+        format: date-time
+        description: ISO 8601 timestamp
+    responses:
+      200:
+        description: The exported bookmarks
+      400:
+        description: Unknown format or invalid updated_since timestamp
+      401:
+        description: Incorrect credentials supplied
+    security:
+      - Bearer: [] 
+    """
+    current_user = get_jwt_identity()
+    export_format = request.args.get('format', 'ndjson')
+
+    if export_format not in EXPORT_FORMATS:
+        return (jsonify({
+            'error': "format must be ndjson or csv"
+        }), HTTPStatus.BAD_REQUEST)
+
+    fields = ('id', 'url', 'short_url', 'visits', 'body', 'created_at', 'updated_at')
+    query = db.session.query(
+        Bookmark.id, Bookmark.url, Bookmark.short_url, Bookmark.visits,
+        Bookmark.body, Bookmark.created_at, Bookmark.updated_at
+    ).filter(Bookmark.user_id == current_user)
+
+    updated_since = request.args.get('updated_since')
+    if updated_since:
+        try:
+            since = datetime.fromisoformat(updated_since)
+        except ValueError:
+            return (jsonify({
+                'error': "updated_since is not an ISO 8601 timestamp"
+            }), HTTPStatus.BAD_REQUEST)
+
+        query = query.filter(func.coalesce(Bookmark.updated_at, Bookmark.created_at) >= since)
+
+    # yield_per streams the rows from a server side cursor in batches
+    rows = query.order_by(Bookmark.id).yield_per(
+        current_app.config.get('EXPORT_BATCH_SIZE', 1000))
+    lines, mimetype = EXPORT_FORMATS[export_format]
 
-    return (jsonify({'data': data}), HTTPStatus.OK)
+    return Response(stream_with_context(lines(rows, fields)), HTTPStatus.OK,
+                    mimetype=mimetype, headers={
+                        'Content-Disposition': f'attachment; filename=bookmarks.{export_format}'
+                    })
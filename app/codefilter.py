@@ -0,0 +1,233 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from app.database import db, Bookmark
+from app.shortcodes import ALPHABET
+
+logger = logging.getLogger(__name__)
+
+CODE_CHARACTERS = frozenset(ALPHABET)
+
+
+class BloomFilter:
+    """
+    Set of strings in ``size`` bits. A string that was added is always
+    found, one that was not is found with a probability of ``error_rate``
+    as long as no more than ``capacity`` strings are added.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        # double hashing, all bit positions from two 64 bit hashes
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+
+class ShortCodeFilter:
+    """
+    Negative lookup filter of the redirect route, one per worker process.
+
+    Paths that can't be a short code, longer than the column, with other
+    characters than base62 or a length no code has, are rejected right
+    away. Everything else is checked against a Bloom filter of all short
+    codes, streamed from the bookmarks table on the first lookup and
+    updated by every bookmark this worker inserts. A code the filter does
+    not know makes it read the bookmarks added since the last refresh, at
+    most every ``refresh_interval`` seconds, so a bookmark created by
+    another worker can 404 here for that long. Deleted codes stay in the
+    filter and are looked up in the database as before. Once the codes
+    outgrow the capacity the filter is rebuilt twice as large.
+    """
+
+    # bookmark ids are taken before the commit, so a refresh reads again
+    # the ids of transactions that may have been open this many seconds
+    OVERLAP = 60
+    MIN_CAPACITY = 100000
+
+    def __init__(self, error_rate=0.01, refresh_interval=1.0, enabled=True):
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.enabled = enabled
+        self.max_length = Bookmark.__table__.c.short_url.type.length
+        self.length = 5
+        self.filter = None
+        self.lengths = set()
+        self.codes = 0
+        self.rejected = 0
+        self.refreshes = 0
+        self._max_id = 0
+        self._checkpoints = deque()
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self._events = False
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SHORT_CODE_FILTER_ENABLED', self.enabled)
+        self.error_rate = app.config.get('SHORT_CODE_FILTER_ERROR_RATE', self.error_rate)
+        self.refresh_interval = app.config.get('SHORT_CODE_FILTER_REFRESH_INTERVAL', self.refresh_interval)
+        self.length = app.config.get('SHORT_CODE_LENGTH', self.length)
+        self.filter = None
+        self._refreshed_at = None
+        app.extensions['short_code_filter'] = self
+
+        if not self._events:
+            event.listen(Bookmark, 'after_insert', self._after_insert)
+            self._events = True
+
+    def might_exist(self, code):
+        """
+        False if no bookmark has the short code, True if one may have it.
+        """
+        if not self.enabled:
+            return True
+
+        if not code or len(code) > self.max_length or not CODE_CHARACTERS.issuperset(code):
+            self.rejected += 1
+            return False
+
+        if self._contains(code):
+            return True
+
+        # one thread refreshes, the others answer from the current filter
+        if self._lock.acquire(blocking=False):
+            try:
+                self._refresh()
+            finally:
+                self._lock.release()
+
+        if self.filter is None:
+            # not loaded, the database decides
+            return True
+        if self._contains(code):
+            return True
+
+        self.rejected += 1
+        return False
+
+    def stats(self):
+        codes = self.filter
+        return {
+            'enabled': self.enabled,
+            'loaded': codes is not None,
+            'codes': self.codes,
+            'capacity': codes.capacity if codes is not None else 0,
+            'error_rate': self.error_rate,
+            'bytes': len(codes.bits) if codes is not None else 0,
+            'lengths': sorted(self.lengths),
+            'rejected': self.rejected,
+            'refreshes': self.refreshes,
+        }
+
+    def _contains(self, code):
+        codes = self.filter
+        return codes is not None and len(code) in self.lengths and code in codes
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+            return
+        self._refreshed_at = now
+        self.refreshes += 1
+
+        try:
+            if self.filter is None or self.codes > self.filter.capacity:
+                self._load(now)
+            else:
+                self._update(now)
+        except SQLAlchemyError:
+            logger.warning("Failed to refresh the short code filter", exc_info=True)
+
+    def _load(self, now):
+        bookmarks = Bookmark.__table__
+        # codes created before this have committed by the time the load ends
+        settled = datetime.now() - timedelta(seconds=self.OVERLAP)
+        settled_id = max_id = codes = 0
+        lengths = {self.length}
+
+        with db.engine.connect() as connection:
+            count = connection.execute(select(func.count(bookmarks.c.id))).scalar()
+            bloom = BloomFilter(max(2 * count, self.MIN_CAPACITY), self.error_rate)
+
+            result = connection.execution_options(stream_results=True).execute(
+                select(bookmarks.c.id, bookmarks.c.short_url, bookmarks.c.created_at))
+            for rows in result.partitions(10000):
+                for id, short_url, created_at in rows:
+                    max_id = max(max_id, id)
+                    if created_at is not None and created_at < settled:
+                        settled_id = max(settled_id, id)
+                    if short_url:
+                        bloom.add(short_url)
+                        lengths.add(len(short_url))
+                        codes += 1
+
+        self._checkpoints = deque([(now - self.OVERLAP, settled_id), (now, max_id)])
+        self._max_id = max_id
+        self.codes = codes
+        self.lengths = lengths
+        self.filter = bloom
+
+    def _update(self, now):
+        bookmarks = Bookmark.__table__
+        previous = self._checkpoints[-1][0]
+
+        # every id up to the checkpoint taken OVERLAP seconds before the
+        # previous refresh had committed by then and was read by it
+        while len(self._checkpoints) > 1 and self._checkpoints[1][0] <= previous - self.OVERLAP:
+            self._checkpoints.popleft()
+        since = self._checkpoints[0][1]
+
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(bookmarks.c.id, bookmarks.c.short_url).where(bookmarks.c.id > since))
+            for id, short_url in rows:
+                if short_url:
+                    self.filter.add(short_url)
+                    self.lengths.add(len(short_url))
+                    if id > self._max_id:
+                        self.codes += 1
+                self._max_id = max(self._max_id, id)
+
+        self._checkpoints.append((now, self._max_id))
+
+    def add(self, codes):
+        """
+        Adds the codes of bookmarks inserted without the ORM, e.g. by the
+        bulk import, so this worker finds them before the next refresh.
+        Rolled back codes stay in the filter, which only costs a lookup.
+        The next refresh counts the codes.
+        """
+        bloom = self.filter
+        if bloom is None:
+            return
+        for code in codes:
+            if code:
+                bloom.add(code)
+                self.lengths.add(len(code))
+
+    def _after_insert(self, mapper, connection, target):
+        self.add([target.short_url])
+
+
+short_code_filter = ShortCodeFilter()
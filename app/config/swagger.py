@@ -1,3 +1,11 @@
+import json
+import os
+import click
+from flask import Response, current_app
+from flask.cli import with_appcontext
+
+DEFAULT_SPEC_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'apispec.json')
+
 template = {
   "swagger": "2.0",
   "info": {
@@ -39,3 +47,62 @@ swagger_config = {
     "swagger_ui": True,
     "specs_route": "/",
 }
+
+
+def init_swagger(app):
+    """
+    Registers the API documentation according to ``SWAGGER_MODE``:
+
+    - ``ui``: flasgger with the Swagger UI, the spec is built on the first
+      request to /apispec.json and cached
+    - ``static``: serves the spec pre-rendered with ``flask apispec`` from
+      ``SWAGGER_SPEC_PATH`` without importing flasgger
+    - ``off``: no documentation routes
+    """
+    mode = app.config.get('SWAGGER_MODE', 'ui')
+
+    if mode == 'ui':
+        from flasgger import Swagger
+        Swagger(app, config=swagger_config, template=template)
+    elif mode == 'static':
+        spec_path = app.config.get('SWAGGER_SPEC_PATH', DEFAULT_SPEC_PATH)
+        app.add_url_rule('/apispec.json', 'apispec', _static_spec_view(spec_path))
+
+    app.cli.add_command(render_apispec)
+
+
+def _static_spec_view(spec_path):
+    spec = {}
+
+    def apispec():
+        if 'body' not in spec:
+            with open(spec_path, 'rb') as spec_file:
+                spec['body'] = spec_file.read()
+        return Response(spec['body'], mimetype='application/json')
+
+    return apispec
+
+
+@click.command('apispec')
+@click.option('--output', default=DEFAULT_SPEC_PATH, show_default=True,
+              help="File the rendered spec is written to")
+@with_appcontext
+def render_apispec(output):
+    """
+    Render the Swagger spec to a file served in SWAGGER_MODE static.
+    """
+    from flasgger import Swagger
+
+    app = current_app._get_current_object()
+    swagger = getattr(app, 'swag', None)
+    if swagger is None:
+        swagger = Swagger(app, config=swagger_config, template=template)
+
+    with app.test_request_context():
+        spec = swagger.get_apispecs(endpoint='apispec')
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as spec_file:
+        json.dump(spec, spec_file, default=str)
+
+    click.echo(f'Swagger spec written to {output}')
@@ -1,11 +1,38 @@
-import string
-import random
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Index, orm
+from sqlalchemy.orm import validates
+from sqlalchemy.sql.expression import UpdateBase
 from datetime import datetime
+from app.shortcodes import short_codes
+from app.passwords import passwords
+from app.urls import url_hash
 
-db = SQLAlchemy()
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending the reads of replica requests to the engine chosen by
+    the replica router in app/replicas.py. Flushes and insert, update and
+    delete statements always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        else:
+            router = self.app.extensions.get('replica_router')
+            engine = router.read_engine() if router is not None else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -13,20 +40,31 @@ class User(db.Model):
     username = Column(String(80), unique=True, nullable=False)
     email = Column(String(120), unique=True, nullable=False)
     password = Column(Text(), nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, onupdate=datetime.now())
+    # bumped by every change of the user's bookmarks, see app/etags.py
+    bookmarks_version = Column(Integer, nullable=False, default=0, server_default='0')
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, onupdate=datetime.now)
     bookmarks = db.relationship('Bookmark', backref="users")
 
     def __init__(self, username, email, password):
         self.username = username
         self.email = email
-        self.password = generate_password_hash(password)
+        self.password = passwords.hash(password)
 
     def __repr__(self) -> str:
         return f'User>>> {self.username} Email>>> {self.email}'
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return passwords.verify(self.password, password)
+
+    def update_password_hash(self, password):
+        """
+        Rehashes a verified password when the configured hash method changed.
+        """
+        if passwords.needs_rehash(self.password):
+            self.password = passwords.hash(password)
+            return True
+        return False
         
 
 class Bookmark(db.Model):
@@ -34,27 +72,66 @@ class Bookmark(db.Model):
     id = Column(Integer, primary_key=True)
     body = Column(Text, nullable=True)
     url = Column(Text, nullable=False)
-    short_url = Column(String(3), nullable=True)
+    # sha256 of the normalized url, see app/urls.py
+    url_hash = Column(String(64), nullable=True)
+    short_url = Column(String(16), nullable=True)
     visits = Column(Integer, default=0)
     user_id = Column(Integer, ForeignKey('users.id'))
-    created_at = Column(DateTime, default=datetime.now())
-    updated_at = Column(DateTime, onupdate=datetime.now())
-
-    def generate_short_characters(self):
-        characters  = string.digits + string.ascii_letters
-        picked_chars=''.join(random.choices(characters, k=3))
-       
-        link=self.query.filter_by(short_url=picked_chars).first()
-        if link:
-            self.generate_short_characters()
-        else:
-            return picked_chars
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, onupdate=datetime.now)
+
+    __table_args__ = (
+        # redirect lookup
+        Index('ix_bookmarks_short_url', 'short_url', unique=True),
+        # detail, update and delete of a single bookmark of a user
+        Index('ix_bookmarks_user_id_id', 'user_id', 'id'),
+        # list, stats and keyset pagination of a user's bookmarks
+        Index('ix_bookmarks_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        # duplicate url check, globally or per user
+        Index('ix_bookmarks_url_hash_user_id', 'url_hash', 'user_id'),
+    )
 
     def __init__(self, url, body, user_id):
         self.url = url
         self.body = body
         self.user_id = user_id
-        self.short_url = self.generate_short_characters()
+        self.short_url = short_codes.allocate()
+
+    @validates('url')
+    def _hash_url(self, key, url):
+        self.url_hash = url_hash(url)
+        return url
+
+    def __repr__(self) -> str:
+        return f'Bookmark>>> {self.url} Short URL>>> {self.short_url}'
+
+
+class ShortCodeCounter(db.Model):
+    __tablename__ = 'short_code_counters'
+    name = Column(String(32), primary_key=True)
+    next_value = Column(BigInteger, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f'ShortCodeCounter>>> {self.name} Next>>> {self.next_value}'
+
+
+class HourlyVisits(db.Model):
+    __tablename__ = 'bookmark_visits_hourly'
+    bookmark_id = Column(Integer, ForeignKey('bookmarks.id', ondelete='CASCADE'), primary_key=True)
+    # start of the UTC hour
+    hour = Column(DateTime, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f'HourlyVisits>>> {self.bookmark_id} Hour>>> {self.hour} Visits>>> {self.visits}'
+
+
+class DailyVisits(db.Model):
+    __tablename__ = 'bookmark_visits_daily'
+    bookmark_id = Column(Integer, ForeignKey('bookmarks.id', ondelete='CASCADE'), primary_key=True)
+    # start of the UTC day, hourly rollups are downsampled into these
+    day = Column(DateTime, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0)
 
     def __repr__(self) -> str:
-        return f'Bookmark>>> {self.url} Short URL>>> {self.short_url}'
\ No newline at end of file
+        return f'DailyVisits>>> {self.bookmark_id} Day>>> {self.day} Visits>>> {self.visits}'
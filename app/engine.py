@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long checkouts wait for a connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = CheckoutStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.checkout_stats.record(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkout_stats = self.checkout_stats
+        return pool
+
+
+class CheckoutStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+
+def engine_options(config):
+    """
+    SQLAlchemy engine options from the ``DATABASE_*`` settings.
+
+    ``DATABASE_PGBOUNCER`` is for a PgBouncer in transaction pooling mode:
+    PgBouncer does the pooling, so the app opens a connection per checkout,
+    and startup parameters are rejected by PgBouncer, so the statement
+    timeout has to be set on the database role instead.
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    uri = config.get('SQLALCHEMY_DATABASE_URI')
+    if not uri:
+        return options
+
+    url = make_url(uri)
+    options.setdefault('pool_pre_ping', config.get('DATABASE_POOL_PRE_PING', True))
+
+    if url.get_backend_name() == 'sqlite':
+        # SQLite uses its own single connection pools
+        return options
+
+    if config.get('DATABASE_PGBOUNCER', False):
+        options.setdefault('poolclass', NullPool)
+    else:
+        options.setdefault('poolclass', InstrumentedQueuePool)
+        options.setdefault('pool_size', config.get('DATABASE_POOL_SIZE', 5))
+        options.setdefault('max_overflow', config.get('DATABASE_MAX_OVERFLOW', 10))
+        options.setdefault('pool_timeout', config.get('DATABASE_POOL_TIMEOUT', 30))
+        options.setdefault('pool_recycle', config.get('DATABASE_POOL_RECYCLE', 1800))
+
+        statement_timeout = config.get('DATABASE_STATEMENT_TIMEOUT')
+        if statement_timeout and url.get_backend_name() == 'postgresql':
+            connect_args = dict(options.get('connect_args') or {})
+            connect_args.setdefault('options', f'-c statement_timeout={int(statement_timeout)}')
+            options['connect_args'] = connect_args
+
+    return options
+
+
+def dispose_after_fork(app):
+    """
+    Drops the connections a forked worker inherited from the parent, e.g.
+    with gunicorn --preload, without closing the parent's sockets. Covers
+    the primary and the replica engines of the app that exist at the fork,
+    none is created before it, so the app starts without a database.
+    """
+    def dispose():
+        state = app.extensions.get('sqlalchemy')
+        if state is None:
+            return
+        for connector in list(state.connectors.values()):
+            connector.get_engine().dispose(close=False)
+
+    os.register_at_fork(after_in_child=dispose)
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        stats.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'saturation': pool.checkedout() / capacity if capacity else 0.0,
+        })
+
+    checkout_stats = getattr(pool, 'checkout_stats', None)
+    if checkout_stats is not None:
+        stats.update({
+            'checkouts': checkout_stats.checkouts,
+            'checkout_wait_seconds': checkout_stats.wait_seconds,
+            'checkout_max_wait_seconds': checkout_stats.max_wait_seconds,
+        })
+
+    return stats
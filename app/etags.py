@@ -0,0 +1,52 @@
+import hashlib
+from flask import Response, request
+from http import HTTPStatus
+from app.database import db, User
+
+users = User.__table__
+
+
+def collection_version(user_id):
+    """
+    Version of the bookmark collection of a user, bumped by every write.
+    """
+    return db.session.query(User.bookmarks_version).filter(User.id == user_id).scalar()
+
+
+def bump_collection_version(user_ids):
+    """
+    Bumps the collection version of the users in the current transaction.
+    """
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+
+    db.session.execute(users.update().where(users.c.id.in_(user_ids)).values(
+        bookmarks_version=users.c.bookmarks_version + 1,
+        # a version bump is not a change of the user
+        updated_at=users.c.updated_at,
+    ))
+
+
+def make_etag(*parts):
+    return hashlib.sha1('/'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def not_modified(etag):
+    """
+    A 304 response when the request already has the current representation.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=HTTPStatus.NOT_MODIFIED)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def with_etag(response, etag):
+    """
+    Sets the ETag on a successful response, errors must not be revalidated.
+    """
+    response, status = response
+    if status == HTTPStatus.OK:
+        response.set_etag(etag)
+    return response, status
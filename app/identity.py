@@ -0,0 +1,65 @@
+from flask import current_app, g
+from flask_jwt_extended import get_current_user
+from sqlalchemy import event
+from app.cache import identity_cache
+from app.database import db, User
+from app.serializers import USER_COLUMNS, USER_FIELDS, serialize_user, user_row
+
+
+def identity_claims(user):
+    """
+    Additional JWT claims carrying the user details, so requests with the
+    token don't have to load the user. Empty when ``JWT_IDENTITY_CLAIMS``
+    is off.
+    """
+    if not current_app.config.get('JWT_IDENTITY_CLAIMS', True):
+        return {}
+    return serialize_user(user)
+
+
+def load_identity(user_id):
+    """
+    Username and email of a user, from the identity cache or the database.
+    """
+    identity = identity_cache.get(user_id)
+
+    if identity is None:
+        row = db.session.query(*USER_COLUMNS).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        identity = user_row(row)
+        identity_cache.set(user_id, identity)
+
+    return identity
+
+
+def current_identity():
+    """
+    Identity of the user of the current request.
+    """
+    return get_current_user()
+
+
+def init_app(app, jwt):
+    """
+    Resolves the identity of every request with a valid token, from the
+    token claims when it carries them and otherwise through the identity
+    cache. Tokens of users that no longer exist are rejected.
+    """
+    identity_cache.init_app(app)
+    identity_claim = app.config.get('JWT_IDENTITY_CLAIM', 'sub')
+
+    @jwt.user_lookup_loader
+    def user_lookup(_jwt_header, jwt_data):
+        if all(field in jwt_data for field in USER_FIELDS):
+            return {field: jwt_data[field] for field in USER_FIELDS}
+        # the token is only saved in the request once it is loaded, the
+        # replica router needs its user to keep recent writers on the primary
+        g.jwt_identity = jwt_data[identity_claim]
+        return load_identity(jwt_data[identity_claim])
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_identity(mapper, connection, target):
+    identity_cache.invalidate(target.id)
@@ -0,0 +1,203 @@
+import logging
+import os
+import threading
+import time
+from flask import Response, current_app, g, has_app_context, has_request_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge,
+                               Histogram, REGISTRY, generate_latest)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.cache import identity_cache, short_url_cache
+from app.database import db
+from app.engine import pool_stats
+from app.singleflight import short_url_lookups
+
+logger = logging.getLogger(__name__)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', "Request latency by endpoint",
+    ['endpoint', 'method', 'status'])
+REQUEST_STATEMENTS = Histogram(
+    'http_request_db_statements', "SQL statements executed per request",
+    ['endpoint'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, float('inf')))
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds', "Time spent in the database per request",
+    ['endpoint'])
+CACHE_HITS = Counter('cache_hits_total', "Cache hits", ['cache'])
+CACHE_MISSES = Counter('cache_misses_total', "Cache misses", ['cache'])
+LOOKUPS_COALESCED = Counter(
+    'coalesced_lookups_total', "Lookups that waited for a concurrent one instead of querying",
+    ['lookup'])
+LOOKUP_TIMEOUTS = Counter(
+    'coalesced_lookup_timeouts_total', "Lookups that gave up waiting for a concurrent one",
+    ['lookup'])
+# the gauges of the pool are summed over the live workers, saturation and
+# the longest wait are kept per worker (pid label)
+POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', "Connections of the database pool by state",
+    ['state'], multiprocess_mode='livesum')
+POOL_CAPACITY = Gauge(
+    'db_pool_capacity', "Pool size plus maximum overflow", multiprocess_mode='livesum')
+POOL_SATURATION = Gauge(
+    'db_pool_saturation', "Checked out connections over the capacity of the pool",
+    multiprocess_mode='liveall')
+POOL_CHECKOUTS = Counter('db_pool_checkouts_total', "Connections checked out of the pool")
+POOL_CHECKOUT_WAIT = Counter(
+    'db_pool_checkout_wait_seconds_total', "Time spent waiting for a connection of the pool")
+POOL_CHECKOUT_MAX_WAIT = Gauge(
+    'db_pool_checkout_max_wait_seconds', "Longest wait for a connection of the pool",
+    multiprocess_mode='liveall')
+
+CACHES = {
+    'short_url': short_url_cache,
+    'identity': identity_cache,
+}
+
+LOOKUPS = {
+    'short_url': short_url_lookups,
+}
+
+
+class Metrics:
+    """
+    Per-request latency, SQL statement count and database time, exported in
+    the Prometheus text format at ``/metrics``, along with cache hits,
+    coalesced lookups and the usage and checkout waits of the database pool.
+
+    With ``PROMETHEUS_MULTIPROC_DIR`` set every gunicorn worker writes its
+    samples to that directory and ``/metrics`` aggregates all of them, see
+    gunicorn.conf.py. Requests slower than ``SLOW_REQUEST_MS`` and
+    statements slower than ``SLOW_QUERY_MS`` are logged with their SQL.
+    """
+
+    def __init__(self):
+        self.slow_request_ms = 1000
+        self.slow_query_ms = 250
+        self._cache_counts = {}
+        self._cache_lock = threading.Lock()
+        self._engine_events = False
+
+    def init_app(self, app):
+        self.slow_request_ms = app.config.get('SLOW_REQUEST_MS', self.slow_request_ms)
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS', self.slow_query_ms)
+        app.extensions['metrics'] = self
+
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+
+        if not self._engine_events:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._engine_events = True
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def metrics_view(self):
+        """
+        Metrics of all workers in the Prometheus text format
+        ---
+        tags:
+          - Monitoring
+        responses:
+          200:
+            description: Request latency, database statements and time per request, cache hits and pool usage
+        """
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+    def _start_request(self):
+        g.request_start = time.perf_counter()
+        g.db_statements = 0
+        g.db_time = 0.0
+        g.slowest_statement = (0.0, None)
+
+    def _finish_request(self, response):
+        if 'request_start' not in g:
+            return response
+
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or 'unmatched'
+
+        REQUEST_LATENCY.labels(endpoint, request.method, response.status_code).observe(elapsed)
+        REQUEST_STATEMENTS.labels(endpoint).observe(g.db_statements)
+        REQUEST_DB_TIME.labels(endpoint).observe(g.db_time)
+        self._count_cache_lookups()
+        self._record_pool()
+
+        if elapsed * 1000 >= self.slow_request_ms:
+            slowest_time, slowest_statement = g.slowest_statement
+            current_app.logger.warning(
+                "Slow request %s %s: %.0f ms, %d statements in %.0f ms, slowest %.0f ms: %s",
+                request.method, request.path, elapsed * 1000, g.db_statements,
+                g.db_time * 1000, slowest_time * 1000, slowest_statement)
+
+        return response
+
+    def _count_cache_lookups(self):
+        # the caches count per process, the counters get the increments
+        # since the last request
+        with self._cache_lock:
+            for name, cache in CACHES.items():
+                hits, misses = cache.hits, cache.misses
+                last_hits, last_misses = self._cache_counts.get(name, (0, 0))
+                if hits > last_hits:
+                    CACHE_HITS.labels(name).inc(hits - last_hits)
+                if misses > last_misses:
+                    CACHE_MISSES.labels(name).inc(misses - last_misses)
+                self._cache_counts[name] = (hits, misses)
+
+            for name, lookups in LOOKUPS.items():
+                coalesced, timeouts = lookups.coalesced, lookups.timeouts
+                last_coalesced, last_timeouts = self._cache_counts.get(('lookups', name), (0, 0))
+                if coalesced > last_coalesced:
+                    LOOKUPS_COALESCED.labels(name).inc(coalesced - last_coalesced)
+                if timeouts > last_timeouts:
+                    LOOKUP_TIMEOUTS.labels(name).inc(timeouts - last_timeouts)
+                self._cache_counts[('lookups', name)] = (coalesced, timeouts)
+
+    def _record_pool(self):
+        # the gauges hold the pool state at the end of the latest request
+        stats = pool_stats(db.engine)
+
+        if 'size' in stats:
+            POOL_CONNECTIONS.labels('checked_out').set(stats['checked_out'])
+            POOL_CONNECTIONS.labels('checked_in').set(stats['checked_in'])
+            POOL_CONNECTIONS.labels('overflow').set(max(stats['overflow'], 0))
+            POOL_CAPACITY.set(stats['size'] + max(stats['max_overflow'], 0))
+            POOL_SATURATION.set(stats['saturation'])
+
+        if 'checkouts' in stats:
+            POOL_CHECKOUT_MAX_WAIT.set(stats['checkout_max_wait_seconds'])
+            with self._cache_lock:
+                checkouts, wait = stats['checkouts'], stats['checkout_wait_seconds']
+                last_checkouts, last_wait = self._cache_counts.get('pool', (0, 0.0))
+                if checkouts > last_checkouts:
+                    POOL_CHECKOUTS.inc(checkouts - last_checkouts)
+                    POOL_CHECKOUT_WAIT.inc(wait - last_wait)
+                self._cache_counts['pool'] = (checkouts, wait)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+
+        if has_request_context() and 'request_start' in g:
+            g.db_statements += 1
+            g.db_time += elapsed
+            if elapsed > g.slowest_statement[0]:
+                g.slowest_statement = (elapsed, statement)
+
+        if elapsed * 1000 >= self.slow_query_ms:
+            log = current_app.logger if has_app_context() else logger
+            log.warning("Slow query: %.0f ms: %s", elapsed * 1000, statement)
+
+
+metrics = Metrics()
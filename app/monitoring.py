@@ -0,0 +1,45 @@
+from flask import Blueprint, jsonify
+from http import HTTPStatus
+from app.cache import identity_cache, short_url_cache
+from app.codefilter import short_code_filter
+from app.singleflight import short_url_lookups
+from app.database import db
+from app.engine import pool_stats
+
+monitoring = Blueprint("monitoring", __name__, url_prefix="/api/v1/monitoring")
+
+@monitoring.get('/cache')
+def cache_stats():
+    """
+    Cache statistics of the worker serving the request
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: >
+          Size, hit, miss and eviction counters of the short url and identity
+          caches, the state of the short code filter and the coalesced short
+          url lookups
+    """
+    return (jsonify({
+        'short_url_cache': short_url_cache.stats(),
+        'identity_cache': identity_cache.stats(),
+        'short_code_filter': short_code_filter.stats(),
+        'short_url_lookups': short_url_lookups.stats(),
+    }), HTTPStatus.OK)
+
+@monitoring.get('/pool')
+def database_pool_stats():
+    """
+    Database connection pool statistics of the worker serving the request
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: Pool usage, saturation and checkout wait times
+    """
+    return (jsonify({
+        'database_pool': pool_stats(db.engine)
+    }), HTTPStatus.OK)
@@ -0,0 +1,96 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """
+    Password hashing with a configurable algorithm and cost.
+
+    ``PASSWORD_HASH_METHOD`` and ``PASSWORD_HASH_ITERATIONS`` form the
+    werkzeug hash method, e.g. ``pbkdf2:sha256:260000``. Hashes created
+    with other parameters still verify and are reported by
+    ``needs_rehash`` so they can be upgraded on the next login.
+
+    With ``PASSWORD_HASH_WORKERS`` set, hashing runs in a thread pool
+    (or a process pool with ``PASSWORD_HASH_EXECUTOR = 'process'``).
+    PBKDF2 releases the GIL, so a thread pool already hashes in parallel.
+    At most ``PASSWORD_HASH_MAX_PENDING`` hashes wait for the pool;
+    beyond that ``HasherBusy`` is raised right away, or after waiting up to
+    ``PASSWORD_HASH_TIMEOUT`` seconds for a slot, instead of queueing the
+    request.
+    """
+
+    def __init__(self):
+        self.method = 'pbkdf2:sha256:260000'
+        self.salt_length = 16
+        self.workers = 0
+        self.executor_type = 'thread'
+        self.timeout = 0
+        self._pending = None
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        method = app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        iterations = app.config.get('PASSWORD_HASH_ITERATIONS', 260000)
+        self.method = f'{method}:{iterations}' if method.startswith('pbkdf2') else method
+        self.salt_length = app.config.get('PASSWORD_SALT_LENGTH', 16)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        self.executor_type = app.config.get('PASSWORD_HASH_EXECUTOR', 'thread')
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 0)
+        self._pending = threading.BoundedSemaphore(
+            self.workers + app.config.get('PASSWORD_HASH_MAX_PENDING', 32))
+        self._shutdown()
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        if self.timeout > 0:
+            acquired = self._pending.acquire(timeout=self.timeout)
+        else:
+            acquired = self._pending.acquire(blocking=False)
+        if not acquired:
+            raise HasherBusy("too many password hashes pending")
+
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._pending.release()
+
+    def _get_executor(self):
+        # pools don't survive a fork, every worker process starts its own
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    executor = ProcessPoolExecutor if self.executor_type == 'process' else ThreadPoolExecutor
+                    self._executor = executor(max_workers=self.workers)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self._executor_pid = None
+
+
+passwords = PasswordHasher()
@@ -0,0 +1,139 @@
+import re
+import click
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import func, text, tuple_
+from app.database import db, Bookmark, DailyVisits, HourlyVisits, User
+from app.search import search_clauses
+
+# plan lines that read a whole table instead of using an index
+SEQUENTIAL_SCANS = {
+    'postgresql': re.compile(r'Seq Scan on (users|bookmarks|bookmark_visits_\w+)\b'),
+    'sqlite': re.compile(r'\bSCAN (users|bookmarks|bookmark_visits_\w+)\b(?! USING)'),
+}
+
+
+def endpoint_queries(user_id=1):
+    """
+    The queries run by each endpoint, with representative parameters.
+    """
+    visits = func.coalesce(Bookmark.visits, 0)
+
+    return {
+        'redirect_to_url': [
+            Bookmark.query.filter_by(short_url='abcde'),
+        ],
+        'handle_bookmark POST': [
+            db.session.query(Bookmark.url_hash).filter(Bookmark.url_hash.in_([64 * '0'])),
+            db.session.query(Bookmark.url_hash).filter(
+                Bookmark.url_hash.in_([64 * '0']), Bookmark.user_id == user_id),
+        ],
+        'handle_bookmark GET page': [
+            Bookmark.query.filter_by(user_id=user_id).order_by(
+                Bookmark.created_at, Bookmark.id).limit(5).offset(500),
+            Bookmark.query.filter_by(user_id=user_id).order_by(None).with_entities(
+                func.count(Bookmark.id)),
+        ],
+        'handle_bookmark GET cursor': [
+            Bookmark.query.filter_by(user_id=user_id).filter(
+                tuple_(Bookmark.created_at, Bookmark.id) > (datetime(2022, 1, 1), 500)
+            ).order_by(Bookmark.created_at, Bookmark.id).limit(6),
+        ],
+        'get_bookmark / update_bookmark / delete_bookmark': [
+            Bookmark.query.filter_by(user_id=user_id, id=42),
+        ],
+        'update_bookmarks / delete_bookmarks': [
+            db.session.query(Bookmark.id, Bookmark.short_url).filter(
+                Bookmark.user_id == user_id, Bookmark.id.in_([1, 2, 3])).order_by(Bookmark.id).limit(1001),
+            db.session.query(Bookmark.id, Bookmark.short_url).filter(
+                Bookmark.user_id == user_id, func.coalesce(Bookmark.visits, 0) <= 0
+            ).order_by(Bookmark.id).limit(1001),
+        ],
+        'get_stats': [
+            db.session.query(func.count(Bookmark.id), func.sum(visits)).filter(
+                Bookmark.user_id == user_id),
+            db.session.query(Bookmark.id, Bookmark.url, Bookmark.short_url, visits).filter(
+                Bookmark.user_id == user_id).order_by(visits.desc(), Bookmark.id).limit(10),
+        ],
+        'get_visits': [
+            db.session.query(HourlyVisits.hour, HourlyVisits.visits).filter(
+                HourlyVisits.bookmark_id == 42, HourlyVisits.hour >= datetime(2022, 1, 1),
+                HourlyVisits.hour < datetime(2022, 1, 8)),
+            db.session.query(DailyVisits.day, DailyVisits.visits).filter(
+                DailyVisits.bookmark_id == 42, DailyVisits.day >= datetime(2022, 1, 1),
+                DailyVisits.day < datetime(2022, 4, 1)),
+        ],
+        'search_bookmarks': [
+            _search_query(user_id, ['python', 'doc']),
+        ],
+        'login': [
+            User.query.filter_by(email='peter@neverland.org'),
+            User.query.filter_by(username='peter'),
+        ],
+        'whoami': [
+            User.query.filter_by(id=user_id),
+        ],
+    }
+
+
+def _search_query(user_id, terms):
+    join, match, rank = search_clauses(db.engine.dialect.name, terms)
+    query = db.session.query(Bookmark.id, rank)
+    if join is not None:
+        query = query.join(*join)
+    return query.filter(Bookmark.user_id == user_id, match).order_by(
+        rank.desc(), Bookmark.id.desc()).limit(6)
+
+
+def explain(query):
+    dialect = db.engine.dialect
+    # expanding IN parameters are rendered as one parameter per value
+    compiled = query.statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+
+    prefix = 'EXPLAIN QUERY PLAN' if dialect.name == 'sqlite' else 'EXPLAIN'
+    rows = db.session.connection().exec_driver_sql(f'{prefix} {compiled}', params)
+
+    if dialect.name == 'sqlite':
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans():
+    """
+    Print the query plan of every endpoint query and fail on sequential scans.
+    """
+    dialect = db.engine.dialect.name
+    sequential_scan = SEQUENTIAL_SCANS.get(dialect)
+
+    if dialect == 'postgresql':
+        # small development tables would be scanned anyway, only fall back
+        # to a sequential scan when there is no usable index
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+
+    failed = []
+
+    for endpoint, queries in endpoint_queries().items():
+        click.echo(f'== {endpoint}')
+        for query in queries:
+            plan = explain(query)
+            for line in plan:
+                click.echo(f'   {line}')
+            click.echo()
+
+            if sequential_scan and any(sequential_scan.search(line) for line in plan):
+                failed.append(endpoint)
+
+    db.session.rollback()
+
+    if failed:
+        raise click.ClickException(
+            f"sequential scan in the queries of: {', '.join(sorted(set(failed)))}")
+
+    click.echo('No sequential scans found')
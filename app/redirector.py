@@ -0,0 +1,317 @@
+"""
+Stand-alone ASGI service for the short url redirect.
+
+It serves only ``/<short_url>``, with an async database driver and its own
+connection pool, so slow lookups wait on the event loop instead of tying up
+a sync worker of the Flask app:
+
+    uvicorn app.redirector:application --host 0.0.0.0 --port 5003
+
+The configuration is read from the same environment variables as the Flask
+app: ``SQLALCHEMY_DATABASE_URI`` (or ``REDIRECT_DATABASE_URI``), the
+``DATABASE_*`` pool settings, ``SHORT_URL_CACHE_*``, ``SHORT_URL_LOOKUP_TIMEOUT``
+and ``VISIT_FLUSH_*``.
+"""
+import asyncio
+import itertools
+import logging
+from collections import Counter
+from datetime import datetime
+from os import environ
+from http import HTTPStatus
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from werkzeug.urls import iri_to_uri
+from app.cache import LRUCache
+from app.database import Bookmark
+from app.serializers import dumps
+from app.visits import hour_of, visit_statements
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+bookmarks = Bookmark.__table__
+
+
+def config_from_env():
+    return {
+        'SQLALCHEMY_DATABASE_URI': environ.get('REDIRECT_DATABASE_URI', environ.get('SQLALCHEMY_DATABASE_URI')),
+        'DATABASE_REPLICA_URIS': [uri for uri in environ.get('DATABASE_REPLICA_URIS', '').split(',') if uri],
+        'DATABASE_POOL_SIZE': int(environ.get('DATABASE_POOL_SIZE', 5)),
+        'DATABASE_MAX_OVERFLOW': int(environ.get('DATABASE_MAX_OVERFLOW', 10)),
+        'DATABASE_POOL_TIMEOUT': float(environ.get('DATABASE_POOL_TIMEOUT', 30)),
+        'DATABASE_POOL_RECYCLE': int(environ.get('DATABASE_POOL_RECYCLE', 1800)),
+        'DATABASE_POOL_PRE_PING': environ.get('DATABASE_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes', 'on'),
+        'DATABASE_STATEMENT_TIMEOUT': int(environ.get('DATABASE_STATEMENT_TIMEOUT', 0)),
+        'DATABASE_PGBOUNCER': environ.get('DATABASE_PGBOUNCER', 'false').lower() in ('1', 'true', 'yes', 'on'),
+        'SHORT_URL_CACHE_SIZE': int(environ.get('SHORT_URL_CACHE_SIZE', 10000)),
+        'SHORT_URL_CACHE_TTL': int(environ.get('SHORT_URL_CACHE_TTL', 300)),
+        'SHORT_URL_LOOKUP_TIMEOUT': float(environ.get('SHORT_URL_LOOKUP_TIMEOUT', 5.0)),
+        'VISIT_FLUSH_INTERVAL': float(environ.get('VISIT_FLUSH_INTERVAL', 5.0)),
+        'VISIT_FLUSH_THRESHOLD': int(environ.get('VISIT_FLUSH_THRESHOLD', 1000)),
+    }
+
+
+def create_engine(config):
+    """
+    Async engine with the pool settings of ``app.engine.engine_options``.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for the {backend} database")
+
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    options = {'pool_pre_ping': config.get('DATABASE_POOL_PRE_PING', True)}
+
+    if backend == 'sqlite':
+        return create_async_engine(url, **options)
+
+    connect_args = {}
+    statement_timeout = config.get('DATABASE_STATEMENT_TIMEOUT')
+
+    if config.get('DATABASE_PGBOUNCER', False):
+        # prepared statements do not survive PgBouncer's transaction pooling
+        options['poolclass'] = NullPool
+        url = url.update_query_dict({'prepared_statement_cache_size': '0'})
+        connect_args['statement_cache_size'] = 0
+    else:
+        options.update({
+            'pool_size': config.get('DATABASE_POOL_SIZE', 5),
+            'max_overflow': config.get('DATABASE_MAX_OVERFLOW', 10),
+            'pool_timeout': config.get('DATABASE_POOL_TIMEOUT', 30),
+            'pool_recycle': config.get('DATABASE_POOL_RECYCLE', 1800),
+        })
+        if statement_timeout:
+            connect_args['server_settings'] = {'statement_timeout': str(int(statement_timeout))}
+
+    return create_async_engine(url, connect_args=connect_args, **options)
+
+
+class RedirectService:
+    """
+    ASGI application resolving short urls to their bookmarked url.
+
+    Visits are counted in memory and written in batches by a background
+    task, like ``app.visits.VisitCounter`` does for the Flask app. Lookups
+    go to the ``DATABASE_REPLICA_URIS`` in turn and fall back to the primary
+    when a replica fails, visits are written to the primary. The
+    short url cache is not invalidated by the Flask app, so an updated or
+    deleted bookmark can still redirect until ``SHORT_URL_CACHE_TTL``
+    expires.
+    """
+
+    def __init__(self, config=None):
+        self.config = config
+        self.engine = None
+        self.replica_engines = []
+        self._next_replica = itertools.count()
+        self.cache = LRUCache('SHORT_URL_CACHE')
+        self.lookup_timeout = 5.0
+        self._lookups = {}
+        self.flush_interval = 5.0
+        self.flush_threshold = 1000
+        self._pending = Counter()
+        self._pending_total = 0
+        self._wakeup = None
+        self._flush_task = None
+        self._stopping = False
+
+    async def startup(self):
+        # no await in here, so concurrent first requests can't start twice
+        if self.engine is not None:
+            return
+
+        config = self.config if self.config is not None else config_from_env()
+        self.cache.maxsize = config.get('SHORT_URL_CACHE_SIZE', self.cache.maxsize)
+        self.cache.ttl = config.get('SHORT_URL_CACHE_TTL', self.cache.ttl)
+        self.lookup_timeout = config.get('SHORT_URL_LOOKUP_TIMEOUT', self.lookup_timeout)
+        self.flush_interval = config.get('VISIT_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_threshold = config.get('VISIT_FLUSH_THRESHOLD', self.flush_threshold)
+
+        self.engine = create_engine(config)
+        self.replica_engines = [
+            create_engine(dict(config, SQLALCHEMY_DATABASE_URI=uri))
+            for uri in config.get('DATABASE_REPLICA_URIS') or []
+        ]
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.get_running_loop().create_task(self._run())
+
+    async def shutdown(self):
+        if self.engine is None:
+            return
+
+        # let the flush task drain the pending visits instead of cancelling
+        # it in the middle of a write
+        self._stopping = True
+        self._wakeup.set()
+        await self._flush_task
+
+        for engine in [self.engine] + self.replica_engines:
+            await engine.dispose()
+        self.engine = None
+        self.replica_engines = []
+
+    async def resolve(self, short_url):
+        cached = self.cache.get(short_url)
+        if cached is not None:
+            return cached
+
+        # concurrent misses for the same code share one query, like
+        # app.singleflight does for the Flask app
+        lookup = self._lookups.get(short_url)
+        if lookup is None:
+            lookup = self._lookups[short_url] = asyncio.ensure_future(self._resolve(short_url))
+            lookup.add_done_callback(lambda _: self._lookups.pop(short_url, None))
+
+        return await asyncio.wait_for(asyncio.shield(lookup), self.lookup_timeout)
+
+    async def _resolve(self, short_url):
+        if self.replica_engines:
+            engine = self.replica_engines[next(self._next_replica) % len(self.replica_engines)]
+            try:
+                row = await self._lookup(engine, short_url)
+            except (SQLAlchemyError, OSError):
+                logger.warning("Replica %s failed, reading from the primary", engine.url, exc_info=True)
+                row = await self._lookup(self.engine, short_url)
+        else:
+            row = await self._lookup(self.engine, short_url)
+
+        if row is None:
+            return None
+
+        cached = (row.id, row.url)
+        self.cache.set(short_url, cached)
+        return cached
+
+    async def _lookup(self, engine, short_url):
+        async with engine.connect() as connection:
+            result = await connection.execute(
+                select(bookmarks.c.id, bookmarks.c.url).where(bookmarks.c.short_url == short_url)
+            )
+            return result.first()
+
+    def record_visit(self, bookmark_id):
+        self._pending[(bookmark_id, hour_of(datetime.utcnow()))] += 1
+        self._pending_total += 1
+        if self._pending_total >= self.flush_threshold:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+
+        batch = self._pending
+        self._pending = Counter()
+        self._pending_total = 0
+
+        try:
+            async with self.engine.begin() as connection:
+                for statement, parameters in visit_statements(batch, connection.dialect.name):
+                    await connection.execute(statement, parameters)
+        except Exception:
+            # put the visits back so the next flush retries them
+            self._pending.update(batch)
+            self._pending_total += sum(batch.values())
+            logger.exception("Failed to flush %d visit counters", len(batch))
+            return 0
+
+        return sum(batch.values())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            return
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            await self._send_json(send, HTTPStatus.METHOD_NOT_ALLOWED, {'error': "Method not allowed"})
+            return
+
+        short_url = scope['path'].lstrip('/')
+        if not short_url or '/' in short_url:
+            await self._send_json(send, HTTPStatus.NOT_FOUND, {'error': "Not found"})
+            return
+
+        try:
+            # servers without lifespan support start the service lazily
+            if self.engine is None:
+                await self.startup()
+            target = await self.resolve(short_url)
+        except asyncio.TimeoutError:
+            await self._send_json(send, HTTPStatus.SERVICE_UNAVAILABLE,
+                                  {'error': "Lookup timed out, please try again"})
+            return
+        except Exception:
+            logger.exception("Failed to resolve short url %s", short_url)
+            await self._send_json(send, HTTPStatus.INTERNAL_SERVER_ERROR,
+                                  {'error': "Something went wrong, please try again"})
+            return
+
+        if target is None:
+            await self._send_json(send, HTTPStatus.NOT_FOUND, {'error': "Not found"})
+            return
+
+        bookmark_id, url = target
+        self.record_visit(bookmark_id)
+
+        await send({
+            'type': 'http.response.start',
+            'status': HTTPStatus.FOUND,
+            'headers': [
+                (b'location', iri_to_uri(url).encode('latin-1')),
+                (b'content-length', b'0'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _send_json(self, send, status, payload):
+        body = dumps(payload).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+application = RedirectService()
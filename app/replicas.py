@@ -0,0 +1,159 @@
+import functools
+import itertools
+import threading
+import time
+from flask import g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from app.cache import LRUCache
+from app.database import db, RoutingSession
+
+# replication lag in seconds, 0 when the replica has replayed everything it
+# received and NULL on a primary
+POSTGRES_REPLICATION_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReplicaRouter:
+    """
+    Routes the reads of GET requests marked with ``read_replica`` to the
+    replicas in ``DATABASE_REPLICA_URIS``, everything else uses the primary.
+
+    A user who wrote is kept on the primary for ``REPLICA_STICKY_TTL``
+    seconds so they read their own writes. Like the caches in app/cache.py
+    this is tracked per worker process. Replicas are checked at most every
+    ``REPLICA_HEALTH_INTERVAL`` seconds, unreachable ones and Postgres
+    replicas lagging more than ``REPLICA_MAX_LAG`` seconds are skipped until
+    the next check, and without a healthy replica the primary serves the
+    reads.
+    """
+
+    def __init__(self, health_interval=10, max_lag=30):
+        self.health_interval = health_interval
+        self.max_lag = max_lag
+        self.app = None
+        self.bind_keys = []
+        self.sticky_users = LRUCache('REPLICA_STICKY', ttl=5)
+        self._health = {}
+        self._health_lock = threading.Lock()
+        self._next = itertools.count()
+
+    def init_app(self, app):
+        self.app = app
+        self.health_interval = app.config.get('REPLICA_HEALTH_INTERVAL', self.health_interval)
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', self.max_lag)
+        self.sticky_users.init_app(app)
+        self._health = {}
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        self.bind_keys = []
+        for index, uri in enumerate(app.config.get('DATABASE_REPLICA_URIS') or []):
+            bind_key = f'replica_{index}'
+            binds[bind_key] = uri
+            self.bind_keys.append(bind_key)
+        app.config['SQLALCHEMY_BINDS'] = binds or None
+
+        app.extensions['replica_router'] = self
+
+    def engines(self):
+        return [db.get_engine(self.app, bind=bind_key) for bind_key in self.bind_keys]
+
+    def read_engine(self):
+        """
+        The replica engine for the reads of the current request, or None
+        for the primary. The choice is kept for the rest of the request.
+        """
+        if not self.bind_keys or not has_request_context() or not g.get('read_replica'):
+            return None
+
+        if 'replica_engine' not in g:
+            g.replica_engine = None if self._is_sticky() else self._choose()
+        return g.replica_engine
+
+    def stick(self, user_id):
+        self.sticky_users.set(user_id, True)
+
+    def _is_sticky(self):
+        user_id = _current_user_id()
+        return user_id is not None and self.sticky_users.get(user_id) is not None
+
+    def _choose(self):
+        engines = self.engines()
+        start = next(self._next)
+        for offset in range(len(engines)):
+            engine = engines[(start + offset) % len(engines)]
+            if self._healthy(engine):
+                return engine
+        return None
+
+    def _healthy(self, engine):
+        healthy, checked_at = self._health.get(engine.url, (True, None))
+        now = time.monotonic()
+        if checked_at is not None and now - checked_at < self.health_interval:
+            return healthy
+
+        # one check at a time, the other requests use the last result
+        if not self._health_lock.acquire(blocking=False):
+            return healthy
+        try:
+            healthy = self._check(engine)
+            self._health[engine.url] = (healthy, time.monotonic())
+        finally:
+            self._health_lock.release()
+        return healthy
+
+    def _check(self, engine):
+        try:
+            with engine.connect() as connection:
+                if engine.dialect.name != 'postgresql':
+                    connection.execute(text("SELECT 1"))
+                    return True
+                lag = connection.execute(POSTGRES_REPLICATION_LAG).scalar()
+        except SQLAlchemyError:
+            self.app.logger.warning("Replica %s is unreachable", engine.url, exc_info=True)
+            return False
+
+        if lag is not None and self.max_lag and lag > self.max_lag:
+            self.app.logger.warning("Replica %s lags %.1f seconds behind", engine.url, lag)
+            return False
+        return True
+
+
+def _current_user_id():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        # no JWT was verified in this request yet, maybe the identity of
+        # the one being loaded
+        return g.get('jwt_identity')
+
+
+def read_replica(view):
+    """
+    Lets the GET and HEAD requests of a view read from a replica.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_writer(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        user_id = _current_user_id()
+        if user_id is not None:
+            replica_router.stick(user_id)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('wrote', None)
+
+
+replica_router = ReplicaRouter()
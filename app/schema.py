@@ -0,0 +1,35 @@
+import os
+from alembic.script import ScriptDirectory
+from sqlalchemy import Column, MetaData, String, Table, event
+from app.database import Bookmark
+
+MIGRATIONS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db')
+
+alembic_version = Table(
+    'alembic_version', MetaData(),
+    Column('version_num', String(32), primary_key=True),
+)
+
+
+def head_revision():
+    return ScriptDirectory(MIGRATIONS_PATH).get_current_head()
+
+
+def init_app(app):
+    """
+    Stamps every schema that create_all builds with the head revision.
+    """
+    if not event.contains(Bookmark.__table__, 'after_create', stamp_head):
+        event.listen(Bookmark.__table__, 'after_create', stamp_head)
+
+
+def stamp_head(target, connection, **kw):
+    """
+    Marks a schema built by create_all, on startup or by flask db reset, as
+    migrated to the head revision, like alembic stamp head. Existing tables
+    are never created again, so older databases keep their revision and
+    get the rest of their schema from flask db migrate.
+    """
+    alembic_version.create(connection, checkfirst=True)
+    connection.execute(alembic_version.delete())
+    connection.execute(alembic_version.insert().values(version_num=head_revision()))
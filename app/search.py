@@ -0,0 +1,69 @@
+import re
+from sqlalchemy import DDL, column, event, func, literal_column, table
+from app.database import Bookmark
+
+bookmarks = Bookmark.__table__
+
+# Postgres: a generated tsvector over the words of url and body, so the
+# database keeps it current on every write. The GIN index leads with
+# user_id (btree_gin), a search only reads the entries of its user instead
+# of those of every user with a matching word.
+POSTGRES_SCHEMA = [
+    "ALTER TABLE bookmarks ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', regexp_replace(url, '[^[:alnum:]]+', ' ', 'g')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED",
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    "CREATE INDEX IF NOT EXISTS ix_bookmarks_user_id_search_vector ON bookmarks "
+    "USING gin (user_id, search_vector)",
+]
+
+# SQLite: an FTS5 index over the bookmarks table, kept current by triggers
+SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS bookmarks_fts USING fts5("
+    "url, body, content='bookmarks', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS bookmarks_fts_insert AFTER INSERT ON bookmarks BEGIN "
+    "INSERT INTO bookmarks_fts(rowid, url, body) VALUES (new.id, new.url, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS bookmarks_fts_delete AFTER DELETE ON bookmarks BEGIN "
+    "INSERT INTO bookmarks_fts(bookmarks_fts, rowid, url, body) VALUES ('delete', old.id, old.url, old.body); END",
+    "CREATE TRIGGER IF NOT EXISTS bookmarks_fts_update AFTER UPDATE OF url, body ON bookmarks BEGIN "
+    "INSERT INTO bookmarks_fts(bookmarks_fts, rowid, url, body) VALUES ('delete', old.id, old.url, old.body); "
+    "INSERT INTO bookmarks_fts(rowid, url, body) VALUES (new.id, new.url, new.body); END",
+]
+SQLITE_DROP = "DROP TABLE IF EXISTS bookmarks_fts"
+
+for statement in POSTGRES_SCHEMA:
+    event.listen(bookmarks, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+for statement in SQLITE_SCHEMA:
+    event.listen(bookmarks, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+# the external content index would outlive the table otherwise
+event.listen(bookmarks, 'before_drop', DDL(SQLITE_DROP).execute_if(dialect='sqlite'))
+
+bookmarks_fts = table('bookmarks_fts', column('rowid'))
+
+
+def search_terms(q):
+    """
+    The words of a search query. Everything else is dropped, so user input
+    never reaches the query syntax of the database.
+    """
+    return re.findall(r'[^\W_]+', q or '')
+
+
+def search_clauses(dialect, terms):
+    """
+    The join, match condition and rank of a search for all of the terms,
+    the last one as a prefix. A higher rank is a better match.
+    """
+    if dialect == 'postgresql':
+        vector = literal_column('bookmarks.search_vector')
+        query = func.to_tsquery('simple', ' & '.join(terms[:-1] + [terms[-1] + ':*']))
+        return None, vector.op('@@')(query), func.ts_rank_cd(vector, query)
+
+    if dialect == 'sqlite':
+        match = ' '.join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+        join = (bookmarks_fts, bookmarks_fts.c.rowid == Bookmark.id)
+        fts = literal_column('bookmarks_fts')
+        # bm25 is lower for better matches
+        return join, fts.op('MATCH')(match), -func.bm25(fts)
+
+    raise NotImplementedError(f"Full text search is not supported on {dialect}")
@@ -0,0 +1,157 @@
+import json
+from datetime import date
+from flask.json import JSONEncoder
+from app.database import Bookmark, User
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# columns loaded on read paths, in the order of the serialized fields
+BOOKMARK_COLUMNS = (
+    Bookmark.id, Bookmark.url, Bookmark.short_url, Bookmark.visits,
+    Bookmark.body, Bookmark.created_at, Bookmark.updated_at,
+)
+BOOKMARK_FIELDS = ('id', 'url', 'short_url', 'visit', 'body', 'created_at', 'updated_at')
+
+USER_COLUMNS = (User.username, User.email)
+USER_FIELDS = ('username', 'email')
+
+
+def bookmark_row(row):
+    """
+    Serializes a tuple of ``BOOKMARK_COLUMNS`` without loading an ORM object.
+    """
+    return dict(zip(BOOKMARK_FIELDS, row))
+
+
+def bookmark_rows(rows):
+    return [dict(zip(BOOKMARK_FIELDS, row)) for row in rows]
+
+
+def serialize_bookmark(bookmark):
+    return {
+        'id': bookmark.id,
+        'url': bookmark.url,
+        'short_url': bookmark.short_url,
+        'visit': bookmark.visits,
+        'body': bookmark.body,
+        'created_at': bookmark.created_at,
+        'updated_at': bookmark.updated_at,
+    }
+
+
+def user_row(row):
+    return dict(zip(USER_FIELDS, row))
+
+
+def serialize_user(user):
+    return {
+        'username': user.username,
+        'email': user.email,
+    }
+
+
+class IsoJSONEncoder(JSONEncoder):
+    """
+    Flask's encoder with dates in ISO 8601 instead of HTTP date format.
+    """
+
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return super().default(o)
+
+
+class OrjsonEncoder(JSONEncoder):
+    """
+    Encodes with orjson, passing datetimes to ``default`` so they keep
+    Flask's HTTP date format. Indented output and anything orjson can't
+    handle go through the standard encoder.
+    """
+
+    # orjson writes datetimes natively in ISO 8601
+    iso_dates = False
+
+    def encode(self, o):
+        if self.indent is not None:
+            return super().encode(o)
+
+        option = orjson.OPT_NON_STR_KEYS
+        if not self.iso_dates:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        try:
+            return orjson.dumps(o, default=self.default, option=option).decode()
+        except orjson.JSONEncodeError:
+            return super().encode(o)
+
+
+class OrjsonIsoEncoder(OrjsonEncoder, IsoJSONEncoder):
+    """
+    Encodes with orjson, datetimes in ISO 8601.
+    """
+
+    iso_dates = True
+
+
+def dumps(obj):
+    """
+    Compact JSON with the encoder selected by ``init_app``.
+    """
+    return _dumps(obj, _encoder)
+
+
+def dumps_iso(obj):
+    """
+    Compact JSON with datetimes in ISO 8601 whatever
+    ``JSON_DATETIME_FORMAT`` is, for exports that are read back.
+    """
+    return _dumps(obj, _iso_encoder)
+
+
+def _stdlib_dumps(obj, encoder):
+    return json.dumps(obj, cls=encoder, separators=(',', ':'))
+
+
+def _orjson_dumps(obj, encoder):
+    return encoder().encode(obj)
+
+
+_dumps = _stdlib_dumps
+_encoder = JSONEncoder
+_iso_encoder = IsoJSONEncoder
+
+
+def init_app(app):
+    """
+    Selects the JSON encoder from ``JSON_BACKEND``: ``orjson``, ``json``
+    or ``auto`` for orjson when it is installed. Datetimes are written in
+    HTTP date format like Flask does, or in ISO 8601 with
+    ``JSON_DATETIME_FORMAT=iso``.
+    """
+    global _dumps, _encoder, _iso_encoder
+
+    backend = app.config.get('JSON_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'orjson' if orjson is not None else 'json'
+
+    datetime_format = app.config.get('JSON_DATETIME_FORMAT', 'http')
+    if datetime_format not in ('http', 'iso'):
+        raise RuntimeError(f"JSON_DATETIME_FORMAT must be http or iso, not {datetime_format!r}")
+
+    if backend == 'orjson':
+        if orjson is None:
+            raise RuntimeError("JSON_BACKEND is orjson but orjson is not installed")
+        _dumps = _orjson_dumps
+        _encoder = OrjsonIsoEncoder if datetime_format == 'iso' else OrjsonEncoder
+        _iso_encoder = OrjsonIsoEncoder
+    else:
+        _dumps = _stdlib_dumps
+        _encoder = IsoJSONEncoder if datetime_format == 'iso' else JSONEncoder
+        _iso_encoder = IsoJSONEncoder
+
+    app.json_encoder = _encoder
@@ -0,0 +1,274 @@
+import hashlib
+import os
+import random
+import string
+import threading
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import IntegrityError
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+
+
+class ShortCodeExhausted(Exception):
+    pass
+
+
+def encode(number, length):
+    """
+    Encode a non-negative integer as a fixed length base62 string.
+    """
+    chars = []
+    for _ in range(length):
+        number, remainder = divmod(number, BASE)
+        chars.append(ALPHABET[remainder])
+
+    if number:
+        raise ValueError(f"number does not fit into {length} base62 characters")
+
+    return ''.join(reversed(chars))
+
+
+def decode(code):
+    number = 0
+    for char in code:
+        number = number * BASE + ALPHABET.index(char)
+    return number
+
+
+class FeistelPermutation:
+    """
+    Keyed bijection of the integers ``[0, domain)`` onto themselves.
+
+    A balanced Feistel network permutes the smallest even bit width that
+    covers the domain, and cycle walking maps values that fall outside of
+    the domain back into it. Consecutive counter values therefore turn
+    into codes that look random but can never collide.
+    """
+
+    def __init__(self, domain, key, rounds=4):
+        bits = max((domain - 1).bit_length(), 2)
+        bits += bits % 2
+        self.domain = domain
+        self.half_bits = bits // 2
+        self.mask = (1 << self.half_bits) - 1
+        self.round_keys = [
+            hashlib.blake2b(f'{key}:{i}'.encode(), digest_size=8).digest()
+            for i in range(rounds)
+        ]
+
+    def _round(self, value, round_key):
+        digest = hashlib.blake2b(value.to_bytes(8, 'big'), digest_size=8, key=round_key).digest()
+        return int.from_bytes(digest, 'big') & self.mask
+
+    def _encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ self._round(right, round_key)
+        return (left << self.half_bits) | right
+
+    def _decrypt(self, value):
+        left, right = value >> self.half_bits, value & self.mask
+        for round_key in reversed(self.round_keys):
+            left, right = right ^ self._round(left, round_key), left
+        return (left << self.half_bits) | right
+
+    def permute(self, value):
+        if not 0 <= value < self.domain:
+            raise ValueError("value outside of the permutation domain")
+        value = self._encrypt(value)
+        while value >= self.domain:
+            value = self._encrypt(value)
+        return value
+
+    def invert(self, value):
+        if not 0 <= value < self.domain:
+            raise ValueError("value outside of the permutation domain")
+        value = self._decrypt(value)
+        while value >= self.domain:
+            value = self._decrypt(value)
+        return value
+
+
+class RandomAllocator:
+    """
+    The original strategy: random codes, each one checked against the
+    database. Kept for deployments that want to stay on 3 character codes,
+    it gets slower as the keyspace fills up and gives up after
+    ``max_attempts`` collisions.
+    """
+
+    def __init__(self, length, max_attempts=10, **options):
+        self.length = length
+        self.max_attempts = max_attempts
+
+    def allocate(self):
+        from app.database import Bookmark
+
+        for _ in range(self.max_attempts):
+            code = ''.join(random.choices(ALPHABET, k=self.length))
+            if Bookmark.query.filter_by(short_url=code).first() is None:
+                return code
+
+        raise ShortCodeExhausted(
+            f"no free short code found after {self.max_attempts} attempts")
+
+    def allocate_many(self, count):
+        return [self.allocate() for _ in range(count)]
+
+
+class BlockAllocator:
+    """
+    Collision free codes from a database backed counter.
+
+    Every worker leases a block of ``block_size`` counter values with a
+    single transaction against the ``short_code_counters`` table and hands
+    them out from memory, so creating a bookmark costs no database round
+    trip until the block is used up. Each counter value is passed through
+    a keyed Feistel permutation and encoded as ``length`` base62
+    characters. The key must never change once codes have been issued.
+    """
+
+    def __init__(self, length, block_size=100, key=0, **options):
+        self.length = length
+        self.block_size = block_size
+        self.counter_name = f'short_code_{length}'
+        self.permutation = FeistelPermutation(BASE ** length, key)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = None
+
+    def allocate(self):
+        with self._lock:
+            # a block leased before a fork would be handed out twice
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._next, self._end = self._lease()
+                self._pid = os.getpid()
+
+            value = self._next
+            self._next += 1
+
+        return self.code_for(value)
+
+    def allocate_many(self, count):
+        """
+        Codes for a bulk insert, leased as one block of ``count`` values.
+        """
+        start, end = self._lease(count)
+        return [self.code_for(value) for value in range(start, end)]
+
+    def code_for(self, value):
+        return encode(self.permutation.permute(value), self.length)
+
+    def value_for(self, code):
+        return self.permutation.invert(decode(code))
+
+    def _lease(self, size=None):
+        from app.database import db
+        size = size or self.block_size
+
+        for _ in range(2):
+            try:
+                with db.engine.begin() as connection:
+                    end = self.advance(connection, size)
+            except IntegrityError:
+                # another worker created the counter row first
+                continue
+            return end - size, end
+
+        raise ShortCodeExhausted("could not lease a block of short codes")
+
+    def advance(self, connection, size):
+        """
+        Moves the counter forward by ``size`` on ``connection``, in the
+        transaction of the caller, and returns its new value.
+        """
+        from app.database import ShortCodeCounter
+        counters = ShortCodeCounter.__table__
+        name_clause = counters.c.name == self.counter_name
+
+        updated = connection.execute(
+            counters.update().where(name_clause).values(
+                next_value=counters.c.next_value + size))
+
+        if updated.rowcount:
+            end = connection.execute(
+                select(counters.c.next_value).where(name_clause)).scalar()
+        else:
+            end = size
+            connection.execute(counters.insert().values(
+                name=self.counter_name, next_value=end))
+
+        if end > self.permutation.domain:
+            raise ShortCodeExhausted(
+                f"all {self.length} character short codes are allocated")
+
+        return end
+
+
+def backfill_short_codes(connection, allocator, batch_size=1000):
+    """
+    Gives every bookmark without a short code one from the counter of the
+    block ``allocator``, on ``connection`` in the transaction of the
+    caller. Returns the number of bookmarks that got a code.
+    """
+    from app.database import Bookmark
+    bookmarks = Bookmark.__table__
+    update = bookmarks.update().where(
+        bookmarks.c.id == bindparam('b_id')
+    ).values(short_url=bindparam('b_short_url'))
+    count = 0
+
+    while True:
+        ids = connection.execute(
+            select(bookmarks.c.id).where(bookmarks.c.short_url.is_(None))
+            .order_by(bookmarks.c.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return count
+
+        end = allocator.advance(connection, len(ids))
+        connection.execute(update, [
+            {'b_id': id, 'b_short_url': allocator.code_for(value)}
+            for id, value in zip(ids, range(end - len(ids), end))
+        ])
+        count += len(ids)
+
+
+ALLOCATORS = {
+    'random': RandomAllocator,
+    'block': BlockAllocator,
+}
+
+
+class ShortCodes:
+    """
+    Hands out short codes for new bookmarks through the allocator selected
+    by ``SHORT_CODE_ALLOCATOR``, either one of the names in ``ALLOCATORS``
+    or an allocator class.
+    """
+
+    def __init__(self):
+        self.allocator = None
+
+    def init_app(self, app):
+        allocator = app.config.get('SHORT_CODE_ALLOCATOR', 'block')
+        if isinstance(allocator, str):
+            allocator = ALLOCATORS[allocator]
+
+        self.allocator = allocator(
+            length=app.config.get('SHORT_CODE_LENGTH', 5),
+            block_size=app.config.get('SHORT_CODE_BLOCK_SIZE', 100),
+            key=app.config.get('SHORT_CODE_KEY', 0),
+        )
+        app.extensions['short_codes'] = self
+
+    def allocate(self):
+        return self.allocator.allocate()
+
+    def allocate_many(self, count):
+        return self.allocator.allocate_many(count)
+
+
+short_codes = ShortCodes()
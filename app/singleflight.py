@@ -0,0 +1,88 @@
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    pass
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a worker process.
+
+    The first caller of a key runs the function, callers arriving while it
+    runs wait for its result, or its exception, instead of running the
+    function again. Waiters give up after ``<config_prefix>_TIMEOUT``
+    seconds with ``SingleFlightTimeout``. Nothing is cached, the next call
+    after the result is in runs the function again. Under gevent the
+    threading primitives are patched, so greenlets coalesce the same way.
+    """
+
+    def __init__(self, config_prefix, timeout=5.0):
+        self.config_prefix = config_prefix
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def init_app(self, app):
+        self.timeout = app.config.get(f'{self.config_prefix}_TIMEOUT', self.timeout)
+        app.extensions[self.config_prefix.lower()] = self
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = function()
+            except BaseException as error:
+                call.error = error
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise SingleFlightTimeout(f"no result for {key!r} after {self.timeout} seconds")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'timeout': self.timeout,
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+            }
+
+
+# short url -> (bookmark id, url) lookups of the redirect route
+short_url_lookups = SingleFlight('SHORT_URL_LOOKUP')
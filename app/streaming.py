@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+from app.serializers import dumps_iso
+
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\r\n'
+# what may follow an element of a JSON array
+DELIMITERS = WHITESPACE + ',]'
+
+
+class StreamError(ValueError):
+    pass
+
+
+def iter_ndjson(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yields one (item, error) tuple per non-empty line of a newline
+    delimited JSON stream. Lines that are not valid JSON yield the
+    parse error instead of an item.
+    """
+    for line in _iter_lines(stream, chunk_size):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError as e:
+            yield None, str(e)
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yields (item, None) for the elements of a top level JSON array while
+    reading the stream, so the whole array is never held in memory.
+    Anything that is not exactly one JSON array raises ``StreamError``.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    # what comes next: start '[', first element or ']', element after a
+    # comma, separator ',' or ']', done nothing but whitespace
+    expect = 'start'
+    end_of_stream = False
+    chunks = _iter_text(stream, chunk_size)
+
+    while not end_of_stream:
+        # drop whatever was consumed and top up the buffer
+        buffer = buffer[position:]
+        position = 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            end_of_stream = True
+        else:
+            buffer += chunk
+
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+
+            if position >= len(buffer):
+                break
+            char = buffer[position]
+
+            if expect == 'done':
+                raise StreamError("unexpected data after the JSON array")
+
+            if expect == 'start':
+                if char != '[':
+                    raise StreamError("expected a JSON array")
+                expect = 'first'
+                position += 1
+                continue
+
+            if expect == 'separator':
+                if char not in ',]':
+                    raise StreamError("expected , or ] after an array element")
+                expect = 'element' if char == ',' else 'done'
+                position += 1
+                continue
+
+            if char == ']' and expect == 'first':
+                expect = 'done'
+                position += 1
+                continue
+
+            if char in ',]':
+                raise StreamError("expected an array element")
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if end_of_stream:
+                    raise StreamError("invalid JSON array")
+                # the element continues in the next chunk
+                break
+
+            # an element is complete once a delimiter follows it, a number
+            # split after its '.' or 'e' decodes to its integer part
+            if end == len(buffer) or buffer[end] not in DELIMITERS:
+                rest = buffer[end:]
+                if not end_of_stream and not any(c in DELIMITERS for c in rest):
+                    break
+                raise StreamError("invalid JSON array")
+
+            position = end
+            expect = 'separator'
+            yield item, None
+
+    if expect != 'done':
+        raise StreamError("unterminated JSON array")
+
+
+def ndjson_lines(rows, fields):
+    """
+    Yields one JSON object per row, datetimes in ISO 8601.
+    """
+    for row in rows:
+        yield dumps_iso(dict(zip(fields, row))) + '\n'
+
+
+def csv_lines(rows, fields):
+    """
+    Yields a CSV header followed by one line per row.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+
+    for row in rows:
+        writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value
+                         for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # the header alone when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _iter_text(stream, chunk_size):
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        chunk = pending + chunk
+        # don't split a multi byte character between two chunks
+        try:
+            yield chunk.decode('utf-8')
+            pending = b''
+        except UnicodeDecodeError as e:
+            if e.start < len(chunk) - 3:
+                raise StreamError("request body is not valid UTF-8")
+            yield chunk[:e.start].decode('utf-8')
+            pending = chunk[e.start:]
+
+    if pending:
+        raise StreamError("request body is not valid UTF-8")
+
+
+def _iter_lines(stream, chunk_size):
+    rest = ''
+    for chunk in _iter_text(stream, chunk_size):
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
@@ -0,0 +1,140 @@
+import bisect
+import csv
+import io
+import itertools
+import random
+import time
+import click
+from datetime import datetime, timedelta
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from app.codefilter import short_code_filter
+from app.database import db, User, Bookmark
+from app.passwords import passwords
+from app.shortcodes import short_codes
+from app.urls import url_hash
+
+WORDS = (
+    'python', 'flask', 'docs', 'guide', 'news', 'recipe', 'travel', 'music', 'video',
+    'blog', 'paper', 'review', 'design', 'linux', 'cloud', 'data', 'search', 'sports',
+    'finance', 'health', 'garden', 'movie', 'book', 'course', 'weather', 'map', 'game',
+)
+
+USER_COLUMNS = ('id', 'username', 'email', 'password', 'bookmarks_version', 'created_at')
+BOOKMARK_COLUMNS = ('body', 'url', 'url_hash', 'short_url', 'visits', 'user_id', 'created_at')
+
+
+class ZipfSampler:
+    """
+    Draws ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** s.
+    """
+
+    def __init__(self, n, s, generator):
+        self.generator = generator
+        self.cumulative = list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+    def sample(self):
+        return bisect.bisect_left(self.cumulative, self.generator.random() * self.cumulative[-1])
+
+
+def bulk_insert(connection, table, columns, rows):
+    """
+    Inserts rows with COPY on Postgres and a single executemany elsewhere.
+    """
+    if connection.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if value is None else value for value in row])
+        buffer.seek(0)
+
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer)
+        finally:
+            cursor.close()
+    else:
+        connection.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+def generate(users, bookmarks, seed=1, exponent=1.1, max_visits=100000, batch_size=10000,
+             password='abcd1234', start=datetime(2022, 1, 1), span=timedelta(days=365), echo=print):
+    """
+    Bulk inserts ``users`` users and ``bookmarks`` bookmarks. Bookmarks per
+    user, domains and visits follow Zipf distributions with the exponent
+    ``exponent``. The same seed gives the same rows.
+    """
+    generator = random.Random(seed)
+    user_table, bookmark_table = User.__table__, Bookmark.__table__
+
+    # one hash for everybody, hashing millions of passwords would take hours
+    password_hash = passwords.hash(password)
+
+    with db.engine.begin() as connection:
+        first_id = (connection.execute(select(func.max(user_table.c.id))).scalar() or 0) + 1
+    user_ids = list(range(first_id, first_id + users))
+
+    started = time.perf_counter()
+    for offset in range(0, users, batch_size):
+        rows = [
+            (user_id, f'synthetic{seed}-{user_id}', f'synthetic{seed}-{user_id}@example.com',
+             password_hash, 0, start + span * index / max(users, 1))
+            for index, user_id in enumerate(user_ids[offset:offset + batch_size], offset)
+        ]
+        with db.engine.begin() as connection:
+            bulk_insert(connection, user_table, USER_COLUMNS, rows)
+
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            # the ids were set explicitly, the sequence has to catch up
+            connection.exec_driver_sql(
+                "SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT max(id) FROM users))")
+    echo(f"{users} users in {time.perf_counter() - started:.1f} s")
+
+    owners = ZipfSampler(users, exponent, generator)
+    domains = ZipfSampler(max(bookmarks // 100, 10), exponent, generator)
+
+    started = time.perf_counter()
+    for offset in range(0, bookmarks, batch_size):
+        count = min(batch_size, bookmarks - offset)
+        codes = short_codes.allocate_many(count)
+        rows = []
+
+        for index, code in zip(range(offset, offset + count), codes):
+            word = WORDS[generator.randrange(len(WORDS))]
+            url = f'https://site{domains.sample()}.example.com/{word}/{index}'
+            body = ' '.join(generator.choice(WORDS) for _ in range(generator.randint(1, 6)))
+            # a random popularity rank, most bookmarks get no visits at all
+            visits = int(max_visits / (generator.randrange(bookmarks) + 1) ** exponent)
+            rows.append((body, url, url_hash(url), code, visits, user_ids[owners.sample()],
+                         start + span * index / bookmarks))
+
+        with db.engine.begin() as connection:
+            bulk_insert(connection, bookmark_table, BOOKMARK_COLUMNS, rows)
+        short_code_filter.add(codes)
+
+        done = offset + count
+        elapsed = time.perf_counter() - started
+        echo(f"{done} bookmarks in {elapsed:.1f} s ({done / elapsed:.0f} rows/s)")
+
+
+@click.command('generate-data')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--bookmarks', default=100000, show_default=True)
+@click.option('--seed', default=1, show_default=True, help="Same seed, same data.")
+@click.option('--zipf', 'exponent', default=1.1, show_default=True,
+              help="Exponent of the bookmarks per user, domain and visit distributions.")
+@click.option('--max-visits', default=100000, show_default=True,
+              help="Visits of the most popular bookmark.")
+@click.option('--batch-size', default=10000, show_default=True)
+@click.option('--password', default='abcd1234', show_default=True,
+              help="Password of every generated user.")
+@with_appcontext
+def generate_data(users, bookmarks, seed, exponent, max_visits, batch_size, password):
+    """
+    Bulk insert synthetic users and bookmarks for performance testing.
+    """
+    generate(users, bookmarks, seed=seed, exponent=exponent, max_visits=max_visits,
+             batch_size=batch_size, password=password, echo=click.echo)
@@ -0,0 +1,49 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# query parameters that only track where a click came from
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'yclid', '_ga'}
+TRACKING_PREFIXES = ('utm_',)
+
+
+def normalize_url(url):
+    """
+    Canonical form of a url for duplicate detection: lower case scheme and
+    host, no default port, no trailing slash, no fragment and no tracking
+    parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+
+    host = (parts.hostname or '').rstrip('.')
+    if ':' in host:
+        host = f'[{host}]'
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{port}'
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo += ':' + parts.password
+        host = f'{userinfo}@{host}'
+
+    path = parts.path.rstrip('/') or '/'
+
+    query = urlencode([
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in TRACKING_PARAMS and not name.lower().startswith(TRACKING_PREFIXES)
+    ])
+
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+def url_hash(url):
+    """
+    Fixed width key of the normalized url, indexed as ``bookmarks.url_hash``.
+    """
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
@@ -2,8 +2,11 @@ import validators
 from flask import Blueprint, jsonify, request
 from http import HTTPStatus
 from app.database import db, User
-from flask_jwt_extended import jwt_required, create_access_token, create_refresh_token, get_jwt_identity
-from flasgger import swag_from
+from app.serializers import USER_FIELDS, serialize_user
+from app.identity import current_identity, identity_claims
+from app.passwords import HasherBusy
+from app.replicas import read_replica
+from flask_jwt_extended import jwt_required, create_access_token, create_refresh_token, get_jwt, get_jwt_identity
 
 user = Blueprint("user", __name__, url_prefix="/api/v1/user")
 
@@ -71,16 +74,18 @@ def register():
         HTTPStatus.CONFLICT)
 
     # add user to the database
-    user=User(username, email, password)
+    try:
+        user=User(username, email, password)
+    except HasherBusy:
+        return (jsonify({'error': "Too many registrations, please try again"}),
+        HTTPStatus.SERVICE_UNAVAILABLE)
+
     db.session.add(user)
     db.session.commit()
 
     return jsonify({
         'message': "User Created",
-        'user': {
-            'username': username,
-            'email': email
-        }
+        'user': serialize_user(user)
     }), HTTPStatus.CREATED
 
 
@@ -128,18 +133,30 @@ def login():
         user=User.query.filter_by(username=username).first()
 
     if user:
-        is_pass_correct = user.check_password(password)
-        
+        try:
+            is_pass_correct = user.check_password(password)
+        except HasherBusy:
+            return (jsonify({
+                'error':"Too many logins, please try again"
+            }), HTTPStatus.SERVICE_UNAVAILABLE)
+
         if is_pass_correct:
-            refresh = create_refresh_token(identity=user.id)
-            access = create_access_token(identity=user.id)
+            try:
+                if user.update_password_hash(password):
+                    db.session.commit()
+            except HasherBusy:
+                # the password is verified, the upgrade waits for the next login
+                pass
+
+            claims = identity_claims(user)
+            refresh = create_refresh_token(identity=user.id, additional_claims=claims)
+            access = create_access_token(identity=user.id, additional_claims=claims)
 
             return (jsonify({
                 'user' : {
                     'access_token':access,
                     'refresh_token':refresh,
-                    'username': user.username,
-                    'email': user.email
+                    **serialize_user(user)
                 }
             }), HTTPStatus.OK)
         else:
@@ -152,6 +169,7 @@ def login():
     }), HTTPStatus.UNAUTHORIZED)
 
 @user.get("/whoami")
+@read_replica
 @jwt_required()
 def whoami():
     """
@@ -175,12 +193,7 @@ def whoami():
     security:
       - Bearer: [] 
     """
-    user_id = get_jwt_identity()
-    user = User.query.filter_by(id=user_id).first()
-    return (jsonify({
-        'username': user.username,
-        'email': user.email
-    }), HTTPStatus.OK)
+    return (jsonify(current_identity()), HTTPStatus.OK)
     
 
 @user.get('/token/refresh')
@@ -201,7 +214,10 @@ def refresh_user_token():
       - Bearer: [] 
     """
     identity = get_jwt_identity()
-    access = create_access_token(identity=identity)
+    claims = get_jwt()
+    access = create_access_token(identity=identity, additional_claims={
+        field: claims[field] for field in USER_FIELDS if field in claims
+    })
 
     return (jsonify({
         'access' : access
@@ -0,0 +1,274 @@
+import atexit
+import os
+import threading
+import click
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import DateTime, Integer, bindparam, cast, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app.database import db, Bookmark, DailyVisits, HourlyVisits, User
+
+UPSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_of(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _parameter(dialect, name, type_):
+    # asyncpg prepares statements server side and can't infer the type of a
+    # selected parameter, SQLite would turn a CAST to DATETIME into a number
+    if dialect == 'postgresql':
+        return cast(bindparam(name), type_)
+    return bindparam(name, type_=type_)
+
+
+def rollup_statement(dialect, table, bucket, source=None):
+    """
+    Upsert adding ``visits`` to the rollup row of a bookmark and bucket.
+    Without a source select it takes ``b_id``, ``b_bucket`` and ``b_visits``
+    parameters and skips bookmarks deleted in the meantime.
+    """
+    if dialect not in UPSERTS:
+        raise NotImplementedError(f"Visit rollups are not supported on {dialect}")
+
+    if source is None:
+        bookmarks = Bookmark.__table__
+        source = select(
+            bookmarks.c.id,
+            _parameter(dialect, 'b_bucket', DateTime),
+            _parameter(dialect, 'b_visits', Integer),
+        ).where(bookmarks.c.id == bindparam('b_id'))
+
+    statement = UPSERTS[dialect](table).from_select(['bookmark_id', bucket, 'visits'], source)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.bookmark_id, table.c[bucket]],
+        set_={'visits': table.c.visits + statement.excluded.visits},
+    )
+
+
+def visit_statements(batch, dialect):
+    """
+    Statements with their parameters that add a batch of visits, keyed by
+    bookmark id and UTC hour, to the bookmarks and their hourly rollups.
+    They belong in one transaction.
+    """
+    totals = Counter()
+    for (bookmark_id, hour), visits in batch.items():
+        totals[bookmark_id] += visits
+
+    bookmarks = Bookmark.__table__
+    increment_visits = bookmarks.update().where(
+        bookmarks.c.id == bindparam('b_id')
+    ).values(
+        visits=func.coalesce(bookmarks.c.visits, 0) + bindparam('b_visits'),
+        # a visit is not an edit of the bookmark
+        updated_at=bookmarks.c.updated_at,
+    )
+
+    users = User.__table__
+    # the visit counts are part of the bookmark list, so its version
+    # has to change for the ETags of the owners
+    bump_versions = users.update().where(users.c.id.in_(
+        select(bookmarks.c.user_id).where(bookmarks.c.id.in_(list(totals)))
+    )).values(
+        bookmarks_version=users.c.bookmarks_version + 1,
+        updated_at=users.c.updated_at,
+    )
+
+    return [
+        (increment_visits, [
+            {'b_id': bookmark_id, 'b_visits': visits}
+            for bookmark_id, visits in totals.items()
+        ]),
+        (rollup_statement(dialect, HourlyVisits.__table__, 'hour'), [
+            {'b_id': bookmark_id, 'b_bucket': hour, 'b_visits': visits}
+            for (bookmark_id, hour), visits in batch.items()
+        ]),
+        (bump_versions, {}),
+    ]
+
+
+def downsample_visits(days, now=None):
+    """
+    Moves the hourly rollups of days that ended more than ``days`` days ago
+    into daily rollups, one transaction per day. Returns the number of days.
+    """
+    hourly, daily = HourlyVisits.__table__, DailyVisits.__table__
+    cutoff = day_of(now or datetime.utcnow()) - timedelta(days=days)
+    downsampled = 0
+
+    while True:
+        with db.engine.begin() as connection:
+            first = connection.execute(
+                select(func.min(hourly.c.hour)).where(hourly.c.hour < cutoff)
+            ).scalar()
+            if first is None:
+                return downsampled
+
+            day = day_of(first)
+            in_day = (hourly.c.hour >= day) & (hourly.c.hour < day + timedelta(days=1))
+            dialect = connection.dialect.name
+
+            source = select(
+                hourly.c.bookmark_id, _parameter(dialect, 'b_bucket', DateTime), func.sum(hourly.c.visits)
+            ).where(in_day).group_by(hourly.c.bookmark_id)
+            connection.execute(rollup_statement(dialect, daily, 'day', source), {'b_bucket': day})
+            connection.execute(hourly.delete().where(in_day))
+            downsampled += 1
+
+
+def delete_visits(bookmark_ids):
+    """
+    Deletes the rollups of bookmarks in the current session, SQLite does not
+    enforce the ON DELETE CASCADE of the rollup tables.
+    """
+    for model in (HourlyVisits, DailyVisits):
+        db.session.query(model).filter(model.bookmark_id.in_(bookmark_ids)).delete(
+            synchronize_session=False)
+
+
+class VisitCounter:
+    """
+    Write-behind visit accounting for the redirect route.
+
+    Visits are collected in memory per bookmark and UTC hour and written in
+    batches of ``UPDATE bookmarks SET visits = visits + n`` statements and
+    upserts of the hourly rollups, either every ``flush_interval`` seconds
+    or as soon as ``flush_threshold`` visits are pending. A failed flush
+    puts its visits back for the next one, after ``max_failures`` failed
+    flushes in a row the pending visits are dropped, so a database that is
+    down doesn't fill the memory. Pending visits are drained when the
+    worker exits. In sync mode every visit is written before the response
+    is returned, which keeps tests deterministic.
+    """
+
+    def __init__(self, flush_interval=5.0, flush_threshold=1000, sync=False, max_failures=5):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.sync = sync
+        self.max_failures = max_failures
+        self.failures = 0
+        self.dropped = 0
+        self.app = None
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker_pid = None
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.get('VISIT_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_threshold = app.config.get('VISIT_FLUSH_THRESHOLD', self.flush_threshold)
+        self.sync = app.config.get('VISIT_COUNTER_SYNC', app.testing)
+        self.max_failures = app.config.get('VISIT_FLUSH_MAX_FAILURES', self.max_failures)
+        self.failures = 0
+        app.extensions['visit_counter'] = self
+
+        if not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+
+    def record(self, bookmark_id, count=1):
+        hour = hour_of(datetime.utcnow())
+        with self._lock:
+            self._pending[(bookmark_id, hour)] += count
+            self._pending_total += count
+            pending_total = self._pending_total
+
+        if self.sync:
+            self.flush()
+            return
+
+        self._ensure_worker()
+        if pending_total >= self.flush_threshold:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        # one flush at a time so batches are applied in order
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = Counter()
+                self._pending_total = 0
+
+            try:
+                with self.app.app_context():
+                    self._write(batch)
+            except Exception:
+                self.failures += 1
+                if self.failures >= self.max_failures:
+                    self.failures = 0
+                    self.dropped += sum(batch.values())
+                    self.app.logger.exception(
+                        "Dropped %d visits after %d failed flushes", sum(batch.values()),
+                        self.max_failures)
+                    return 0
+
+                # put the visits back so the next flush retries them
+                with self._lock:
+                    self._pending.update(batch)
+                    self._pending_total += sum(batch.values())
+                self.app.logger.exception("Failed to flush %d visit counters", len(batch))
+                return 0
+
+            self.failures = 0
+            return sum(batch.values())
+
+    def _write(self, batch):
+        with db.engine.begin() as connection:
+            for statement, parameters in visit_statements(batch, connection.dialect.name):
+                connection.execute(statement, parameters)
+
+    def _ensure_worker(self):
+        # the flush thread does not survive a fork, so every worker process
+        # starts its own on the first recorded visit
+        if self._worker_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+            thread = threading.Thread(target=self._run, name="visit-counter-flush", daemon=True)
+            thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+visit_counter = VisitCounter()
+
+
+@click.command('downsample-visits')
+@click.option('--days', type=int, default=None,
+              help="Keep hourly visits of this many days, VISIT_HOURLY_RETENTION_DAYS by default.")
+@with_appcontext
+def downsample_visits_command(days):
+    """
+    Move old hourly visit rollups into daily ones.
+    """
+    if days is None:
+        days = current_app.config.get('VISIT_HOURLY_RETENTION_DAYS', 30)
+    click.echo(f"Downsampled {downsample_visits(days)} days of hourly visits")
@@ -0,0 +1,270 @@
+"""
+Endpoint load benchmark.
+
+Seeds a reproducible dataset and drives the redirect, unknown short url
+(scan), bookmark list, create, search, stats, login and whoami endpoints
+through the app with concurrent clients. Reports throughput, p50/p95/p99 latency and database queries per
+request for every scenario, optionally as a JSON file to diff between
+commits.
+
+    python -m bench.load [--users 10] [--bookmarks 500] [--clients 8] [--requests 200]
+                         [--database-uri postgresql://...] [--json results.json]
+
+Without ``--database-uri`` it runs against a temporary SQLite file. A given
+database is reset, so point it at a scratch database.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import create_app
+from app.database import db, User, Bookmark
+from app.shortcodes import ALPHABET
+from app.visits import visit_counter
+
+PASSWORD = 'benchmark'
+
+
+class QueryCounter:
+    """
+    Counts the statements executed by the threads that enabled counting,
+    so the background visit flushes don't show up in a request's count.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        if getattr(self._local, 'enabled', False):
+            self._local.queries += 1
+
+    def start(self):
+        self._local.enabled = True
+        self._local.queries = 0
+
+    def stop(self):
+        self._local.enabled = False
+        return self._local.queries
+
+
+def seed(app, users, bookmarks, seed_value):
+    """
+    Users and bookmarks like db/seeds.py, at a configurable size. The same
+    seed value gives the same dataset.
+    """
+    generator = random.Random(seed_value)
+
+    with app.app_context():
+        db.drop_all(bind=None)
+        db.create_all(bind=None)
+
+        user_ids = []
+        for index in range(users):
+            user = User(f'bench{index}', f'bench{index}@example.com', PASSWORD)
+            db.session.add(user)
+            db.session.flush()
+            user_ids.append(user.id)
+        # the short code allocator leases blocks on its own connection,
+        # which an open write transaction would block on SQLite
+        db.session.commit()
+
+        short_urls = []
+        for index in range(bookmarks):
+            user_id = user_ids[index % users]
+            domain = f'site{generator.randrange(max(bookmarks // 10, 1))}.example.com'
+            bookmark = Bookmark(f'https://{domain}/page/{index}', f'Bookmark {index}', user_id)
+            db.session.add(bookmark)
+            short_urls.append(bookmark.short_url)
+            if index % 1000 == 999:
+                db.session.commit()
+        db.session.commit()
+
+    return user_ids, short_urls
+
+
+def scenarios(short_urls):
+    def redirect(client, session, number):
+        return client.get('/' + session.random.choice(short_urls)), 302
+
+    def scan(client, session, number):
+        # what scanners send: random codes and well known paths
+        paths = ('wp-admin', 'favicon.ico', ''.join(session.random.choices(ALPHABET, k=5)))
+        return client.get('/' + session.random.choice(paths)), 404
+
+    def list_bookmarks(client, session, number):
+        page = session.random.randint(1, 5)
+        return client.get(f'/api/v1/bookmarks/?page={page}', headers=session.headers), 200
+
+    def create_bookmark(client, session, number):
+        return client.post('/api/v1/bookmarks/', headers=session.headers, json={
+            'url': f'https://bench.example.com/{session.index}/{number}',
+            'body': 'created by the load benchmark',
+        }), 201
+
+    def search(client, session, number):
+        term = f'site{session.random.randrange(max(len(short_urls) // 10, 1))}'
+        return client.get(f'/api/v1/bookmarks/search?q={term}', headers=session.headers), 200
+
+    def stats(client, session, number):
+        return client.get('/api/v1/bookmarks/stats', headers=session.headers), 200
+
+    def login(client, session, number):
+        return client.post('/api/v1/user/login', json={
+            'email': session.email, 'password': PASSWORD}), 200
+
+    def whoami(client, session, number):
+        return client.get('/api/v1/user/whoami', headers=session.headers), 200
+
+    return {
+        'redirect': redirect,
+        'scan': scan,
+        'list': list_bookmarks,
+        'create': create_bookmark,
+        'search': search,
+        'stats': stats,
+        'login': login,
+        'whoami': whoami,
+    }
+
+
+class ClientSession:
+
+    def __init__(self, app, index, users, seed_value):
+        self.index = index
+        self.client = app.test_client()
+        self.random = random.Random(seed_value * 1000 + index)
+        self.email = f'bench{index % users}@example.com'
+
+        response = self.client.post('/api/v1/user/login', json={
+            'email': self.email, 'password': PASSWORD})
+        assert response.status_code == 200, response.json
+        self.headers = {'Authorization': 'Bearer ' + response.json['user']['access_token']}
+
+
+def percentile(values, fraction):
+    # nearest rank on sorted values
+    return values[max(int(round(fraction * len(values))) - 1, 0)]
+
+
+def run_scenario(sessions, scenario, requests, warmup, counter):
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+    per_client = max(requests // len(sessions), 1)
+
+    def client(session):
+        for number in range(warmup):
+            scenario(session.client, session, -number - 1)
+
+        timings, counts, failures = [], [], 0
+        for number in range(per_client):
+            counter.start()
+            start = time.perf_counter()
+            response, expected = scenario(session.client, session, number)
+            timings.append(time.perf_counter() - start)
+            counts.append(counter.stop())
+            if response.status_code != expected:
+                failures += 1
+
+        with lock:
+            latencies.extend(timings)
+            queries.extend(counts)
+            errors.append(failures)
+
+    threads = [threading.Thread(target=client, args=(session,)) for session in sessions]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-uri', help="defaults to a temporary SQLite file")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--bookmarks', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="per scenario")
+    parser.add_argument('--warmup', type=int, default=5, help="unmeasured requests per client")
+    parser.add_argument('--iterations', type=int, default=260000, help="password hash iterations")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scenarios', help="comma separated, defaults to all")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = args.database_uri or 'sqlite:///' + os.path.join(directory, 'bench.db')
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': database_uri,
+            'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+            'CREATE_SCHEMA_ON_STARTUP': False,
+            'JWT_SECRET_KEY': 'bench',
+            'PASSWORD_HASH_ITERATIONS': args.iterations,
+            'SWAGGER_MODE': 'off',
+        })
+
+        user_ids, short_urls = seed(app, args.users, args.bookmarks, args.seed)
+        sessions = [ClientSession(app, index, len(user_ids), args.seed) for index in range(args.clients)]
+        counter = QueryCounter()
+
+        available = scenarios(short_urls)
+        selected = args.scenarios.split(',') if args.scenarios else list(available)
+
+        results = {}
+        for name in selected:
+            results[name] = run_scenario(sessions, available[name], args.requests, args.warmup, counter)
+            result = results[name]
+            print(f'{name:10} {result["requests_per_second"]:8.1f} req/s  '
+                  f'p50 {result["p50_ms"]:7.2f} ms  p95 {result["p95_ms"]:7.2f} ms  '
+                  f'p99 {result["p99_ms"]:7.2f} ms  {result["queries_per_request"]:5.2f} queries/req'
+                  + (f'  {result["errors"]} errors' if result['errors'] else ''))
+
+        # write the pending visits before the temporary database goes away
+        visit_counter.flush()
+        with app.app_context():
+            dialect = db.engine.dialect.name
+            db.engine.dispose()
+
+    if args.json:
+        with open(args.json, 'w') as results_file:
+            json.dump({
+                'commit': git_commit(),
+                'database': dialect,
+                'dataset': {'users': args.users, 'bookmarks': args.bookmarks, 'seed': args.seed},
+                'clients': args.clients,
+                'unit': 'ms',
+                'results': results,
+            }, results_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Login throughput benchmark.
+
+Runs concurrent logins through the app against a temporary SQLite file
+and reports logins per second and latency percentiles for the configured
+hash cost, hashing inline and in a pool.
+
+    python -m bench.login [--clients 8] [--logins 200] [--iterations 260000] [--workers 4]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from app import create_app
+from app.database import db, User
+
+
+def run(config, clients, logins):
+    app = create_app(config)
+
+    with app.app_context():
+        db.session.add(User('bench', 'bench@example.com', 'benchmark'))
+        db.session.commit()
+
+    latencies = []
+    lock = threading.Lock()
+    per_client = logins // clients
+
+    def client():
+        test_client = app.test_client()
+        timings = []
+        for _ in range(per_client):
+            start = time.perf_counter()
+            response = test_client.post('/api/v1/user/login', json={
+                'email': 'bench@example.com', 'password': 'benchmark'})
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.json
+        with lock:
+            latencies.extend(timings)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'logins/s': len(latencies) / elapsed,
+        'p50 ms': statistics.median(latencies) * 1000,
+        'p95 ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=260000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    for label, workers in (('inline', 0), (f'pool of {args.workers}', args.workers)):
+        with tempfile.TemporaryDirectory() as directory:
+            result = run({
+                'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'bench.db'),
+                'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+                'JWT_SECRET_KEY': 'bench',
+                'PASSWORD_HASH_ITERATIONS': args.iterations,
+                'PASSWORD_HASH_WORKERS': workers,
+            }, args.clients, args.logins)
+
+        print(f'{label:12} ' + '  '.join(f'{name} {value:8.1f}' for name, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark of the bookmark list serialization, per 1000 rows.
+
+Compares the previous path (ORM objects, hand built dicts, Flask's
+standard encoder) with column tuples and the serializers in
+app/serializers.py using the configured JSON backend.
+
+    python -m bench.serialization [--rows 1000] [--repeat 50]
+"""
+import argparse
+import json
+import statistics
+import time
+from flask.json import JSONEncoder
+from app import create_app, serializers
+from app.database import db, Bookmark, User
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'JWT_SECRET_KEY': 'bench',
+    })
+
+    with app.app_context():
+        user = User('bench', 'bench@example.com', 'benchmark')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        db.session.execute(Bookmark.__table__.insert(), [{
+            'url': f'https://example.com/{i}',
+            'body': f'Bookmark number {i}',
+            'short_url': f'b{i:07d}',
+            'user_id': user_id,
+            'visits': i,
+        } for i in range(args.rows)])
+        db.session.commit()
+
+        def orm_query():
+            db.session.expunge_all()
+            return Bookmark.query.filter_by(user_id=user_id).all()
+
+        def tuple_query():
+            return db.session.query(*serializers.BOOKMARK_COLUMNS).filter(
+                Bookmark.user_id == user_id).all()
+
+        def before(items):
+            data = [{
+                'id': bookmark.id,
+                'url': bookmark.url,
+                'short_url': bookmark.short_url,
+                'visit': bookmark.visits,
+                'body': bookmark.body,
+                'created_at': bookmark.created_at,
+                'updated_at': bookmark.updated_at,
+            } for bookmark in items]
+            return json.dumps({'data': data}, cls=JSONEncoder)
+
+        def after(rows):
+            return serializers.dumps({'data': serializers.bookmark_rows(rows)})
+
+        def after_iso(rows):
+            return serializers.dumps_iso({'data': serializers.bookmark_rows(rows)})
+
+        items = orm_query()
+        rows = tuple_query()
+        scale = 1000 / args.rows
+        results = {
+            'before: query + serialize': measure(lambda: before(orm_query()), args.repeat),
+            'after:  query + serialize': measure(lambda: after(tuple_query()), args.repeat),
+            'before: serialize only': measure(lambda: before(items), args.repeat),
+            'after:  serialize only': measure(lambda: after(rows), args.repeat),
+            'after:  serialize only, ISO': measure(lambda: after_iso(rows), args.repeat),
+        }
+
+    backend = app.config.get('JSON_BACKEND', 'auto')
+    print(f'{args.rows} rows, JSON backend {backend} '
+          f'({"orjson" if serializers.orjson else "json"} available)')
+    for name, seconds in results.items():
+        print(f'{name:28} {seconds * scale * 1000:8.2f} ms per 1k rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Worker startup benchmark.
+
+Measures the wall clock of ``import app`` and ``create_app()`` in fresh
+interpreters, the way every gunicorn worker and pod restart pays for
+them, for the development and production startup profiles.
+
+    python -m bench.startup [--runs 10] [--database-uri sqlite:///...] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported}))
+"""
+
+
+def probe(env):
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', PROBE], env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-uri', help="defaults to a temporary SQLite file")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = args.database_uri or 'sqlite:///' + os.path.join(directory, 'bench.db')
+        spec_path = os.path.join(directory, 'apispec.json')
+        base_env = dict(os.environ,
+                        PYTHONPATH=root,
+                        FLASK_APP='app',
+                        SQLALCHEMY_DATABASE_URI=database_uri,
+                        JWT_SECRET_KEY='bench',
+                        SWAGGER_SPEC_PATH=spec_path)
+
+        # schema and spec are prepared up front, like a migrated database
+        # and an image built with the pre-rendered spec
+        subprocess.run([sys.executable, '-W', 'ignore', '-m', 'flask', 'apispec',
+                        '--output', spec_path], env=base_env, check=True,
+                       capture_output=True, cwd=root)
+
+        for profile in ('development', 'production'):
+            env = dict(base_env, STARTUP_PROFILE=profile)
+            runs = [probe(env) for _ in range(args.runs)]
+            results[profile] = {
+                phase: statistics.median(run[phase] for run in runs) * 1000
+                for phase in ('import', 'create_app')
+            }
+
+    for profile, timings in results.items():
+        print(f'{profile:12} import {timings["import"]:7.1f} ms  '
+              f'create_app {timings["create_app"]:7.1f} ms')
+
+    if args.json:
+        with open(args.json, 'w') as results_file:
+            json.dump({'unit': 'ms', 'runs': args.runs, 'results': results},
+                      results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
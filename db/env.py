@@ -1,4 +1,5 @@
 from logging.config import fileConfig
+from os import environ
 
 from alembic import context
 from sqlalchemy import engine_from_config
@@ -8,6 +9,9 @@ from app import create_app
 
 
 # There's no access to current_app here so we must create our own app.
+# The schema is what the migrations are about, so don't let the app
+# create missing tables on startup.
+environ.setdefault("CREATE_SCHEMA_ON_STARTUP", "false")
 app = create_app()
 db_uri = app.config["SQLALCHEMY_DATABASE_URI"]
 db = app.extensions["sqlalchemy"].db
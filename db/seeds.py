@@ -1,4 +1,6 @@
+from os import environ
 from app.database import db, User, Bookmark
+from app.synthetic import generate
 
 # add some users to the database
 users = [
@@ -16,16 +18,31 @@ bookmarks = [
     { "url" : "http://linked.in", "body": "LinkedIn"},
 ]
 
+# seeds.py is exec'd inside a function, so no comprehensions over these locals
+usernames = []
 for user in users:
+    usernames.append(user["username"])
+existing = set()
+for username, in db.session.query(User.username).filter(User.username.in_(usernames)):
+    existing.add(username)
 
-    if User.query.filter_by(username=user["username"]).first() is None:
-        usr = User(user["username"], user["email"], user["password"])
-        db.session.add(usr)
-        #db.session.commit()
+new_users = []
+for user in users:
+    if user["username"] not in existing:
+        new_users.append(User(user["username"], user["email"], user["password"]))
+db.session.add_all(new_users)
+# committed before the bookmarks lease their short codes, which SQLite
+# would block behind an open write transaction
+db.session.commit()
+
+# only new users are seeded, so they have no bookmarks yet
+for usr in new_users:
+    for bookmark in bookmarks:
+        db.session.add(Bookmark(bookmark["url"], bookmark["body"], usr.id))
+db.session.commit()
 
-        for bookmark in bookmarks:
-            if Bookmark.query.filter_by(url=bookmark["url"], user_id=usr.id).first() is None:
-                book = Bookmark(bookmark["url"], bookmark["body"], usr.id)
-                db.session.add(book)
-            
-        db.session.commit()
+# flask db seed and flask db reset add a synthetic dataset of this size,
+# see flask generate-data --help for the distributions
+if environ.get('SEED_BOOKMARKS'):
+    generate(int(environ.get('SEED_USERS', 1000)), int(environ['SEED_BOOKMARKS']),
+             seed=int(environ.get('SEED', 1)))
@@ -0,0 +1,57 @@
+"""initial schema
+
+The users and bookmarks tables as they were before the first migration,
+so a new database can be built by the migrations alone. Databases created
+by create_all before the migrations existed already have the tables and
+skip this revision's work.
+
+Revision ID: 1d2e7f4a9c60
+Revises:
+Create Date: 2026-10-18 18:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d2e7f4a9c60'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('users'):
+        op.create_table('users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=80), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email'),
+            sa.UniqueConstraint('username')
+        )
+
+    if not inspector.has_table('bookmarks'):
+        op.create_table('bookmarks',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('body', sa.Text(), nullable=True),
+            sa.Column('url', sa.Text(), nullable=False),
+            sa.Column('short_url', sa.String(length=3), nullable=True),
+            sa.Column('visits', sa.Integer(), nullable=True),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('bookmarks')
+    op.drop_table('users')
@@ -0,0 +1,46 @@
+"""bookmark visit rollups
+
+Hourly and daily visit counts per bookmark for the visits endpoint. The
+redirect upserts the hourly rows with every visit flush, flask
+downsample-visits moves old hourly rows into the daily table. Visits
+before this migration only exist in bookmarks.visits.
+
+Revision ID: 3f8a6d2c9b15
+Revises: a1e5c8b7d204
+Create Date: 2026-10-18 21:05:37.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a6d2c9b15'
+down_revision = 'a1e5c8b7d204'
+branch_labels = None
+depends_on = None
+
+TABLES = {
+    'bookmark_visits_hourly': 'hour',
+    'bookmark_visits_daily': 'day',
+}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    # the app creates missing tables on startup, so they may already exist
+    for table, bucket in TABLES.items():
+        if not inspector.has_table(table):
+            op.create_table(table,
+                sa.Column('bookmark_id', sa.Integer(), nullable=False),
+                sa.Column(bucket, sa.DateTime(), nullable=False),
+                sa.Column('visits', sa.Integer(), nullable=False),
+                sa.ForeignKeyConstraint(['bookmark_id'], ['bookmarks.id'], ondelete='CASCADE'),
+                sa.PrimaryKeyConstraint('bookmark_id', bucket)
+            )
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_table(table)
@@ -0,0 +1,49 @@
+"""short code allocator
+
+Widens bookmarks.short_url so codes longer than the original 3 random
+characters fit, and adds the counter table the block allocator leases
+code blocks from. Existing 3 character codes stay valid: the block
+allocator issues codes of SHORT_CODE_LENGTH characters, so as long as
+that is not 3 the new codes can never collide with the old ones.
+
+Revision ID: 4c009d296585
+Revises: 1d2e7f4a9c60
+Create Date: 2026-10-18 18:45:12.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c009d296585'
+down_revision = '1d2e7f4a9c60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bookmarks') as batch_op:
+        batch_op.alter_column('short_url',
+                              existing_type=sa.String(length=3),
+                              type_=sa.String(length=16),
+                              existing_nullable=True)
+
+    # the app creates missing tables on startup, so the counter table may
+    # already exist by the time the migration runs
+    if not sa.inspect(op.get_bind()).has_table('short_code_counters'):
+        op.create_table('short_code_counters',
+            sa.Column('name', sa.String(length=32), nullable=False),
+            sa.Column('next_value', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade():
+    op.drop_table('short_code_counters')
+
+    with op.batch_alter_table('bookmarks') as batch_op:
+        batch_op.alter_column('short_url',
+                              existing_type=sa.String(length=16),
+                              type_=sa.String(length=3),
+                              existing_nullable=True)
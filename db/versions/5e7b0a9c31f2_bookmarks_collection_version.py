@@ -0,0 +1,35 @@
+"""bookmarks collection version
+
+Per user version of the bookmark collection, bumped by every write and
+used to answer conditional list requests without loading rows.
+
+Revision ID: 5e7b0a9c31f2
+Revises: d2a6e81f0c53
+Create Date: 2026-10-18 19:31:55.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7b0a9c31f2'
+down_revision = 'd2a6e81f0c53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a schema from create_all may already have the column
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('users')}
+    if 'bookmarks_version' in columns:
+        return
+
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('bookmarks_version', sa.Integer(),
+                                      nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('bookmarks_version')
@@ -0,0 +1,41 @@
+"""bookmarks user search index
+
+Replaces the GIN index on search_vector with one on (user_id,
+search_vector) through btree_gin. A search for a common word then reads
+the index entries of one user, not those of every user. Creating the
+extension needs a role that may create it, btree_gin is trusted from
+Postgres 13 on. Nothing changes on SQLite, FTS5 has no composite index.
+
+Revision ID: 6b3d9e0f4a27
+Revises: 3f8a6d2c9b15
+Create Date: 2026-10-18 23:12:48.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b3d9e0f4a27'
+down_revision = '3f8a6d2c9b15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_bookmarks_user_id_search_vector ON bookmarks "
+               "USING gin (user_id, search_vector)")
+    op.execute("DROP INDEX IF EXISTS ix_bookmarks_search_vector")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("CREATE INDEX IF NOT EXISTS ix_bookmarks_search_vector ON bookmarks "
+               "USING gin (search_vector)")
+    op.execute("DROP INDEX IF EXISTS ix_bookmarks_user_id_search_vector")
@@ -0,0 +1,71 @@
+"""bookmarks url hash
+
+Hash of the normalized url for the duplicate check, indexed together with
+user_id for global and per user deduplication. Existing bookmarks are
+backfilled in batches and the hash index on url is dropped.
+
+Revision ID: 7c4d2f9e1a83
+Revises: 5e7b0a9c31f2
+Create Date: 2026-10-18 20:12:40.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.urls import url_hash
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4d2f9e1a83'
+down_revision = '5e7b0a9c31f2'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+bookmarks = sa.table(
+    'bookmarks',
+    sa.column('id', sa.Integer),
+    sa.column('url', sa.Text),
+    sa.column('url_hash', sa.String(64)),
+)
+
+
+def upgrade():
+    # a schema from create_all may already have the column
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('bookmarks')}
+    if 'url_hash' not in columns:
+        with op.batch_alter_table('bookmarks') as batch_op:
+            batch_op.add_column(sa.Column('url_hash', sa.String(64), nullable=True))
+
+    connection = op.get_bind()
+    update = bookmarks.update().where(
+        bookmarks.c.id == sa.bindparam('b_id')
+    ).values(url_hash=sa.bindparam('b_url_hash'))
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(bookmarks.c.id, bookmarks.c.url)
+            .where(bookmarks.c.id > last_id, bookmarks.c.url_hash.is_(None))
+            .order_by(bookmarks.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        connection.execute(update, [
+            {'b_id': row.id, 'b_url_hash': url_hash(row.url)} for row in rows
+        ])
+        last_id = rows[-1].id
+
+    op.create_index('ix_bookmarks_url_hash_user_id', 'bookmarks', ['url_hash', 'user_id'],
+                    unique=False, if_not_exists=True)
+    op.drop_index('ix_bookmarks_url', table_name='bookmarks', if_exists=True)
+
+
+def downgrade():
+    op.create_index('ix_bookmarks_url', 'bookmarks', ['url'],
+                    unique=False, postgresql_using='hash', if_not_exists=True)
+    op.drop_index('ix_bookmarks_url_hash_user_id', table_name='bookmarks')
+    with op.batch_alter_table('bookmarks') as batch_op:
+        batch_op.drop_column('url_hash')
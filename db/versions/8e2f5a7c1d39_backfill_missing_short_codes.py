@@ -0,0 +1,36 @@
+"""backfill missing short codes
+
+Bookmarks created while the old random generator failed to find a free
+code were saved without a short_url and can't be reached by a redirect.
+They get codes from the block allocator counter, with the
+SHORT_CODE_LENGTH and SHORT_CODE_KEY the app runs with, so later codes
+never repeat them. Downgrading keeps the codes.
+
+Revision ID: 8e2f5a7c1d39
+Revises: 6b3d9e0f4a27
+Create Date: 2026-10-19 09:26:14.000000
+
+"""
+from os import environ
+from alembic import op
+import sqlalchemy as sa
+from app.shortcodes import BlockAllocator, backfill_short_codes
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2f5a7c1d39'
+down_revision = '6b3d9e0f4a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    allocator = BlockAllocator(
+        length=int(environ.get('SHORT_CODE_LENGTH', 5)),
+        key=int(environ.get('SHORT_CODE_KEY', 0)),
+    )
+    backfill_short_codes(op.get_bind(), allocator)
+
+
+def downgrade():
+    pass
@@ -0,0 +1,29 @@
+"""bookmarks keyset index
+
+Composite index backing the cursor pagination of a user's bookmarks
+ordered by (created_at, id).
+
+Revision ID: 9b1f3c27d4e8
+Revises: 4c009d296585
+Create Date: 2026-10-18 18:52:40.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1f3c27d4e8'
+down_revision = '4c009d296585'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_bookmarks_user_id_created_at_id', 'bookmarks',
+                    ['user_id', 'created_at', 'id'], unique=False,
+                    if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_bookmarks_user_id_created_at_id', table_name='bookmarks')
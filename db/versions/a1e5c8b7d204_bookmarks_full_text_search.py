@@ -0,0 +1,48 @@
+"""bookmarks full text search
+
+Full text index over bookmark url and body for the search endpoint: a
+generated tsvector column with a GIN index on Postgres, an FTS5 table kept
+current by triggers on SQLite. The statements are shared with create_all
+in app/search.py. Adding the generated column rewrites the bookmarks table
+on Postgres.
+
+Revision ID: a1e5c8b7d204
+Revises: 7c4d2f9e1a83
+Create Date: 2026-10-18 20:41:05.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.search import POSTGRES_SCHEMA, SQLITE_DROP, SQLITE_SCHEMA
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1e5c8b7d204'
+down_revision = '7c4d2f9e1a83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        for statement in POSTGRES_SCHEMA:
+            op.execute(statement)
+    elif dialect == 'sqlite':
+        for statement in SQLITE_SCHEMA:
+            op.execute(statement)
+        # index the existing bookmarks
+        op.execute("INSERT INTO bookmarks_fts(bookmarks_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_bookmarks_search_vector")
+        op.execute("ALTER TABLE bookmarks DROP COLUMN IF EXISTS search_vector")
+    elif dialect == 'sqlite':
+        for trigger in ('bookmarks_fts_insert', 'bookmarks_fts_delete', 'bookmarks_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute(SQLITE_DROP)
@@ -0,0 +1,36 @@
+"""bookmark lookup indexes
+
+Indexes for every hot bookmark lookup: a unique index on short_url for
+the redirect, (user_id, id) for detail/update/delete and a hash index on
+url for the duplicate check. List, stats and cursor pagination use the
+(user_id, created_at, id) index from the previous revision.
+
+Revision ID: d2a6e81f0c53
+Revises: 9b1f3c27d4e8
+Create Date: 2026-10-18 19:04:09.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6e81f0c53'
+down_revision = '9b1f3c27d4e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_bookmarks_short_url', 'bookmarks', ['short_url'],
+                    unique=True, if_not_exists=True)
+    op.create_index('ix_bookmarks_user_id_id', 'bookmarks', ['user_id', 'id'],
+                    unique=False, if_not_exists=True)
+    op.create_index('ix_bookmarks_url', 'bookmarks', ['url'],
+                    unique=False, postgresql_using='hash', if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_bookmarks_url', table_name='bookmarks')
+    op.drop_index('ix_bookmarks_user_id_id', table_name='bookmarks')
+    op.drop_index('ix_bookmarks_short_url', table_name='bookmarks')
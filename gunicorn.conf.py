@@ -0,0 +1,19 @@
+# Loaded by gunicorn from the working directory, see the Dockerfile.
+import os
+import shutil
+
+# the workers write their metrics to files in this directory, which is
+# emptied on startup so counters of previous runs don't add up. It has to
+# be set before prometheus_client is imported.
+multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,47 @@
+import pytest
+from app import create_app
+from app.cache import identity_cache, short_url_cache
+from app.database import db
+
+TEST_CONFIG = {
+    'TESTING': True,
+    'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+    'JWT_SECRET_KEY': 'test',
+    'METRICS_ENABLED': False,
+    'SWAGGER_MODE': 'off',
+    'VISIT_COUNTER_SYNC': True,
+    'PASSWORD_HASH_ITERATIONS': 1000,
+}
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """
+    Builds the app on a SQLite file of the test, settings override
+    ``TEST_CONFIG``.
+    """
+    def make_app(**config):
+        return create_app({
+            **TEST_CONFIG,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+            **config,
+        })
+
+    identity_cache.clear()
+    short_url_cache.clear()
+    yield make_app
+    db.session.remove()
+    identity_cache.clear()
+    short_url_cache.clear()
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,117 @@
+import random
+import pytest
+from sqlalchemy import event
+from app.codefilter import BloomFilter, short_code_filter
+from app.database import db, Bookmark, User
+from app.shortcodes import ALPHABET, short_codes
+
+
+def random_codes(count, length=5, seed=0):
+    generator = random.Random(seed)
+    return {''.join(generator.choices(ALPHABET, k=length)) for _ in range(count)}
+
+
+@pytest.fixture
+def user(app):
+    user = User('alice', 'alice@example.com', 'secret')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def add_bookmarks(user, count, orm=True):
+    if orm:
+        bookmarks = [Bookmark(url=f'https://example.com/{random.random()}', body='',
+                              user_id=user.id) for _ in range(count)]
+        db.session.add_all(bookmarks)
+        db.session.commit()
+        return [bookmark.short_url for bookmark in bookmarks]
+
+    # like another worker, without the insert event of this one
+    codes = short_codes.allocate_many(count)
+    db.session.execute(Bookmark.__table__.insert(), [
+        {'url': f'https://example.com/{code}', 'user_id': user.id, 'short_url': code}
+        for code in codes])
+    db.session.commit()
+    return codes
+
+
+@pytest.mark.parametrize('error_rate', [0.01, 0.05])
+def test_bloom_filter_has_no_false_negatives_and_its_error_rate(error_rate):
+    codes = random_codes(5000, seed=1)
+    bloom = BloomFilter(len(codes), error_rate)
+    for code in codes:
+        bloom.add(code)
+
+    others = random_codes(20000, seed=2) - codes
+
+    assert all(code in bloom for code in codes)
+    assert sum(code in bloom for code in others) / len(others) < 1.5 * error_rate
+
+
+def test_filter_finds_every_code(app, user):
+    codes = add_bookmarks(user, 50)
+    assert short_code_filter.might_exist(codes[0])
+
+    codes += add_bookmarks(user, 50)
+
+    assert all(short_code_filter.might_exist(code) for code in codes)
+
+
+def test_filter_finds_codes_inserted_after_the_last_refresh(make_app):
+    app = make_app(SHORT_CODE_FILTER_REFRESH_INTERVAL=0)
+
+    with app.app_context():
+        user = User('alice', 'alice@example.com', 'secret')
+        db.session.add(user)
+        db.session.commit()
+        codes = add_bookmarks(user, 20, orm=False)
+        assert all(short_code_filter.might_exist(code) for code in codes)
+
+        later = add_bookmarks(user, 20, orm=False)
+
+        assert all(short_code_filter.might_exist(code) for code in later)
+        assert short_code_filter.stats()['codes'] == 40
+
+
+def test_filter_uses_the_configured_error_rate(make_app):
+    app = make_app(SHORT_CODE_FILTER_ERROR_RATE=0.05)
+
+    with app.app_context():
+        short_code_filter.might_exist('abcde')
+
+        assert short_code_filter.filter.error_rate == 0.05
+        assert short_code_filter.stats()['error_rate'] == 0.05
+
+
+def count_redirect_queries(app, code):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = app.test_client().get(f'/{code}')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return response.status_code, len(statements)
+
+
+def test_unknown_codes_are_answered_without_a_query(app, user):
+    code, = add_bookmarks(user, 1)
+    short_code_filter.might_exist(code)
+
+    assert count_redirect_queries(app, 'wp-admin') == (404, 0)
+    # the lookup, then the synchronous visit flush
+    status, queries = count_redirect_queries(app, code)
+    assert status == 302 and queries >= 1
+
+
+def test_disabled_filter_is_bypassed(make_app):
+    app = make_app(SHORT_CODE_FILTER_ENABLED=False)
+
+    with app.app_context():
+        assert short_code_filter.might_exist('wp-admin')
+        assert short_code_filter.stats()['loaded'] is False
+        assert count_redirect_queries(app, 'zzzzz') == (404, 1)
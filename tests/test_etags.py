@@ -0,0 +1,33 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from app.database import db, User
+
+
+@pytest.fixture
+def headers(app):
+    user = User('alice', 'alice@example.com', 'secret')
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f"Bearer {create_access_token(identity=user.id)}"}
+
+
+def test_list_is_revalidated_with_its_etag(client, headers):
+    client.post('/api/v1/bookmarks/', json={'url': 'https://example.com'}, headers=headers)
+
+    response = client.get('/api/v1/bookmarks/', headers=headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get('/api/v1/bookmarks/', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    client.post('/api/v1/bookmarks/', json={'url': 'https://example.org'}, headers=headers)
+    response = client.get('/api/v1/bookmarks/', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_invalid_cursor_has_no_etag(client, headers):
+    response = client.get('/api/v1/bookmarks/?cursor=garbage', headers=headers)
+
+    assert response.status_code == 400
+    assert 'ETag' not in response.headers
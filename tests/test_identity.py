@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app.database import db, User
+from app.identity import identity_claims
+
+
+@pytest.fixture
+def app(app):
+    db.session.add(User(username='alice', email='alice@example.com', password='x'))
+    db.session.commit()
+    return app
+
+
+@pytest.fixture
+def user(app):
+    return User.query.filter_by(username='alice').one()
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def whoami(app, token):
+    db.session.remove()
+    return app.test_client().get('/api/v1/user/whoami',
+                                 headers={'Authorization': f"Bearer {token}"})
+
+
+def test_whoami_with_identity_claims_makes_no_query(app, user):
+    token = create_access_token(identity=user.id, additional_claims=identity_claims(user))
+
+    with count_queries() as statements:
+        response = whoami(app, token)
+
+    assert response.status_code == 200
+    assert response.get_json() == {'username': 'alice', 'email': 'alice@example.com'}
+    assert statements == []
+
+
+def test_whoami_with_warm_identity_cache_makes_no_query(app, user):
+    app.config['JWT_IDENTITY_CLAIMS'] = False
+    token = create_access_token(identity=user.id, additional_claims=identity_claims(user))
+
+    with count_queries() as statements:
+        response = whoami(app, token)
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+    with count_queries() as statements:
+        response = whoami(app, token)
+    assert response.status_code == 200
+    assert response.get_json() == {'username': 'alice', 'email': 'alice@example.com'}
+    assert statements == []
+
+
+def test_whoami_after_user_update_reloads_identity(app, user):
+    app.config['JWT_IDENTITY_CLAIMS'] = False
+    token = create_access_token(identity=user.id)
+    whoami(app, token)
+
+    user = db.session.get(User, user.id)
+    user.email = 'alice@example.org'
+    db.session.commit()
+
+    with count_queries() as statements:
+        response = whoami(app, token)
+    assert response.get_json()['email'] == 'alice@example.org'
+    assert len(statements) == 1
+
+
+def test_register_and_login_return_the_serialized_user(app):
+    client = app.test_client()
+    credentials = {'username': 'bob', 'email': 'bob@example.com', 'password': 'secret1'}
+
+    response = client.post('/api/v1/user/register', json=credentials)
+    assert response.status_code == 201
+    assert response.get_json()['user'] == {'username': 'bob', 'email': 'bob@example.com'}
+
+    response = client.post('/api/v1/user/login', json=credentials)
+    login = response.get_json()['user']
+    assert {login['username'], login['email']} == {'bob', 'bob@example.com'}
+
+    with count_queries() as statements:
+        response = whoami(app, login['access_token'])
+    assert response.get_json() == {'username': 'bob', 'email': 'bob@example.com'}
+    assert statements == []
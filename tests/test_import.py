@@ -0,0 +1,46 @@
+import json
+import pytest
+from flask_jwt_extended import create_access_token
+from app.database import db, Bookmark, ShortCodeCounter, User
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app(IMPORT_CHUNK_SIZE=3, SHORT_CODE_BLOCK_SIZE=100)
+    with app.app_context():
+        db.session.add(User(username='alice', email='alice@example.com', password='x'))
+        db.session.commit()
+        yield app
+
+
+@pytest.fixture
+def headers(app):
+    user = User.query.filter_by(username='alice').one()
+    return {'Authorization': f"Bearer {create_access_token(identity=user.id)}"}
+
+
+def import_bookmarks(app, headers, items):
+    response = app.test_client().post('/api/v1/bookmarks/import', headers=headers,
+                                      data=json.dumps(items), content_type='application/json')
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_import_leases_the_short_codes_of_each_chunk_at_once(app, headers):
+    items = [{'url': f'https://example.com/{i}'} for i in range(6)]
+    items.insert(2, {'url': 'https://example.com/0'})
+
+    lines = import_bookmarks(app, headers, items)
+
+    assert lines[-1] == {'summary': {'created': 6, 'duplicate': 1, 'invalid': 0}}
+    codes = [line['short_url'] for line in lines if line.get('status') == 'created']
+    assert len(set(codes)) == 6
+    assert sorted(codes) == sorted(code for code, in db.session.query(Bookmark.short_url))
+    # a block per chunk of exactly its new bookmarks, not SHORT_CODE_BLOCK_SIZE
+    assert db.session.query(ShortCodeCounter.next_value).scalar() == 6
+
+
+def test_import_stops_at_a_malformed_array(app, headers):
+    lines = import_bookmarks(app, headers, None)
+
+    assert lines[-1]['summary']['created'] == 0
+    assert 'error' in lines[-1]['summary']
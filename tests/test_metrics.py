@@ -0,0 +1,30 @@
+from prometheus_client import CONTENT_TYPE_LATEST
+from app.engine import InstrumentedQueuePool
+
+
+def test_metrics_content_type(make_app):
+    client = make_app(METRICS_ENABLED=True).test_client()
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == CONTENT_TYPE_LATEST
+
+
+def test_metrics_export_pool_usage_and_checkout_waits(make_app):
+    app = make_app(METRICS_ENABLED=True, SQLALCHEMY_ENGINE_OPTIONS={
+        'poolclass': InstrumentedQueuePool, 'pool_size': 2, 'max_overflow': 1})
+    client = app.test_client()
+
+    client.get('/api/v1/monitoring/pool')
+    body = client.get('/metrics').get_data(as_text=True)
+
+    for series in ('db_pool_connections{state="checked_out"}',
+                   'db_pool_connections{state="checked_in"}',
+                   'db_pool_connections{state="overflow"}',
+                   'db_pool_capacity 3.0',
+                   'db_pool_saturation',
+                   'db_pool_checkouts_total',
+                   'db_pool_checkout_wait_seconds_total',
+                   'db_pool_checkout_max_wait_seconds'):
+        assert series in body
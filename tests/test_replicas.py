@@ -0,0 +1,58 @@
+import shutil
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app.database import db, User
+from app.replicas import replica_router
+
+
+@pytest.fixture
+def app(make_app, tmp_path):
+    app = make_app(JWT_IDENTITY_CLAIMS=False,
+                   DATABASE_REPLICA_URIS=[f"sqlite:///{tmp_path / 'replica.db'}"])
+    with app.app_context():
+        db.session.add(User('alice', 'alice@example.com', 'secret'))
+        db.session.commit()
+        db.session.remove()
+        # the replica gets the data by replication
+        shutil.copy(tmp_path / 'test.db', tmp_path / 'replica.db')
+        replica_router.sticky_users.clear()
+        yield app
+        replica_router.sticky_users.clear()
+
+
+def user_queries(engine, statements):
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM users' in statement:
+            statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return before_cursor_execute
+
+
+def whoami_queries(app):
+    user = User.query.filter_by(username='alice').one()
+    token = create_access_token(identity=user.id)
+    db.session.remove()
+    primary, replica = [], []
+    listeners = [(engine, user_queries(engine, statements))
+                 for engine, statements in ((db.engine, primary),
+                                            (replica_router.engines()[0], replica))]
+    try:
+        response = app.test_client().get('/api/v1/user/whoami',
+                                         headers={'Authorization': f"Bearer {token}"})
+    finally:
+        for engine, listener in listeners:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+    assert response.get_json() == {'username': 'alice', 'email': 'alice@example.com'}
+    return len(primary), len(replica)
+
+
+def test_whoami_loads_the_identity_from_a_replica(app):
+    assert whoami_queries(app) == (0, 1)
+
+
+def test_whoami_of_a_recent_writer_loads_the_identity_from_the_primary(app):
+    replica_router.stick(User.query.filter_by(username='alice').one().id)
+
+    assert whoami_queries(app) == (1, 0)
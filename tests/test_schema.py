@@ -0,0 +1,8 @@
+from app.database import db
+from app.schema import alembic_version, head_revision
+
+
+def test_create_all_stamps_the_head_revision(app):
+    versions = db.session.execute(alembic_version.select()).scalars().all()
+
+    assert versions == [head_revision()]
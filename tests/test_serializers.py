@@ -0,0 +1,48 @@
+from datetime import datetime
+import pytest
+from flask import Flask, jsonify
+from werkzeug.http import http_date
+from app import serializers
+
+MOMENT = datetime(2022, 5, 17, 8, 12, 31)
+BACKENDS = ['json'] + (['orjson'] if serializers.orjson is not None else [])
+
+
+def encode(backend, datetime_format=None):
+    app = Flask(__name__)
+    app.config['JSON_BACKEND'] = backend
+    if datetime_format is not None:
+        app.config['JSON_DATETIME_FORMAT'] = datetime_format
+    serializers.init_app(app)
+
+    with app.app_context():
+        response = jsonify({'created_at': MOMENT})
+    return response.get_json()['created_at'], serializers.dumps({'created_at': MOMENT})
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_datetimes_default_to_http_date(backend):
+    body, dumped = encode(backend)
+
+    assert body == http_date(MOMENT)
+    assert dumped == '{"created_at":"%s"}' % http_date(MOMENT)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_datetimes_in_iso_format_on_opt_in(backend):
+    body, dumped = encode(backend, 'iso')
+
+    assert body == MOMENT.isoformat()
+    assert dumped == '{"created_at":"%s"}' % MOMENT.isoformat()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_exports_use_iso_format(backend):
+    encode(backend)
+
+    assert serializers.dumps_iso({'created_at': MOMENT}) == '{"created_at":"%s"}' % MOMENT.isoformat()
+
+
+def test_unknown_datetime_format_is_rejected():
+    with pytest.raises(RuntimeError):
+        encode('json', 'rfc3339')
@@ -0,0 +1,93 @@
+import pytest
+from app.database import db, Bookmark, ShortCodeCounter, User
+from app.shortcodes import (ALPHABET, BlockAllocator, FeistelPermutation, RandomAllocator,
+                            backfill_short_codes, decode, encode, short_codes)
+
+
+def counter_value():
+    return db.session.query(ShortCodeCounter.next_value).scalar()
+
+
+@pytest.mark.parametrize('domain', [62 ** 2, 1000, 7])
+def test_permute_is_a_bijection(domain):
+    permutation = FeistelPermutation(domain, key=42)
+
+    values = [permutation.permute(value) for value in range(domain)]
+
+    assert sorted(values) == list(range(domain))
+    assert [permutation.invert(value) for value in values] == list(range(domain))
+
+
+def test_permutation_depends_on_the_key():
+    first, second = FeistelPermutation(62 ** 3, key=1), FeistelPermutation(62 ** 3, key=2)
+
+    assert [first.permute(value) for value in range(10)] != [second.permute(value) for value in range(10)]
+
+
+def test_encode_and_decode_round_trip():
+    assert encode(0, 5) == '00000'
+    assert decode(encode(62 ** 5 - 1, 5)) == 62 ** 5 - 1
+    with pytest.raises(ValueError):
+        encode(62 ** 3, 3)
+
+
+def test_block_codes_are_unique_across_blocks(make_app):
+    app = make_app(SHORT_CODE_BLOCK_SIZE=3, SHORT_CODE_LENGTH=6)
+
+    with app.app_context():
+        codes = [short_codes.allocate() for _ in range(10)] + short_codes.allocate_many(4)
+
+    assert len(set(codes)) == 14
+    assert all(len(code) == 6 and set(code) <= set(ALPHABET) for code in codes)
+
+
+def test_counter_advances_by_block_size(make_app):
+    app = make_app(SHORT_CODE_BLOCK_SIZE=4)
+
+    with app.app_context():
+        short_codes.allocate()
+        assert counter_value() == 4
+        for _ in range(3):
+            short_codes.allocate()
+        assert counter_value() == 4
+        short_codes.allocate()
+        assert counter_value() == 8
+
+
+def test_random_allocator_still_works(make_app):
+    app = make_app(SHORT_CODE_ALLOCATOR='random', SHORT_CODE_LENGTH=3)
+
+    with app.app_context():
+        assert isinstance(short_codes.allocator, RandomAllocator)
+        user = User('alice', 'alice@example.com', 'secret')
+        db.session.add(user)
+        db.session.commit()
+        bookmark = Bookmark(url='https://example.com', body='', user_id=user.id)
+        db.session.add(bookmark)
+        db.session.commit()
+
+        assert len(bookmark.short_url) == 3
+        assert counter_value() is None
+
+
+def test_backfill_gives_bookmarks_without_code_one(make_app):
+    app = make_app(SHORT_CODE_BLOCK_SIZE=10)
+
+    with app.app_context():
+        user = User('alice', 'alice@example.com', 'secret')
+        db.session.add(user)
+        db.session.commit()
+        issued = short_codes.allocate()
+        db.session.execute(Bookmark.__table__.insert(), [
+            {'url': f'https://example.com/{i}', 'user_id': user.id, 'short_url': None}
+            for i in range(5)
+        ])
+        db.session.commit()
+
+        with db.engine.begin() as connection:
+            count = backfill_short_codes(connection, BlockAllocator(5), batch_size=2)
+
+        codes = [code for code, in db.session.query(Bookmark.short_url)]
+        assert count == 5
+        assert None not in codes and len(set(codes + [issued])) == 6
+        assert counter_value() == 15
@@ -0,0 +1,113 @@
+import threading
+import time
+import pytest
+from app.singleflight import SingleFlight, SingleFlightTimeout, short_url_lookups
+
+WAITERS = 8
+
+
+def run_concurrently(flight, key, function):
+    """
+    Calls ``flight.do`` from WAITERS threads while ``function`` blocks, and
+    returns what every thread got.
+    """
+    results = [None] * WAITERS
+
+    def call(index):
+        try:
+            results[index] = ('result', flight.do(key, function))
+        except Exception as error:
+            results[index] = ('error', error)
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(WAITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def blocking(function, started, release):
+    def wrapper():
+        started.set()
+        release.wait(5)
+        return function()
+    return wrapper
+
+
+def wait_for_waiters(flight, count):
+    deadline = time.monotonic() + 5
+    while flight.stats()['coalesced'] < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_concurrent_calls_run_the_function_once():
+    flight = SingleFlight('TEST', timeout=5)
+    calls = []
+    started, release = threading.Event(), threading.Event()
+
+    def load():
+        calls.append(1)
+        return 'https://example.com'
+
+    releaser = threading.Thread(target=lambda: (started.wait(5), wait_for_waiters(flight, WAITERS - 1),
+                                                release.set()))
+    releaser.start()
+    results = run_concurrently(flight, 'code', blocking(load, started, release))
+    releaser.join(5)
+
+    assert len(calls) == 1
+    assert results == [('result', 'https://example.com')] * WAITERS
+    assert flight.stats()['coalesced'] == WAITERS - 1
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_an_error_reaches_every_waiter():
+    flight = SingleFlight('TEST', timeout=5)
+    started, release = threading.Event(), threading.Event()
+    error = RuntimeError("database is down")
+
+    def load():
+        raise error
+
+    releaser = threading.Thread(target=lambda: (started.wait(5), wait_for_waiters(flight, WAITERS - 1),
+                                                release.set()))
+    releaser.start()
+    results = run_concurrently(flight, 'code', blocking(load, started, release))
+    releaser.join(5)
+
+    assert results == [('error', error)] * WAITERS
+    assert flight.stats()['errors'] == 1
+
+
+def test_waiters_give_up_after_the_timeout():
+    flight = SingleFlight('TEST', timeout=0.05)
+    started, release = threading.Event(), threading.Event()
+    leader = threading.Thread(target=flight.do, args=('code', blocking(lambda: None, started, release)))
+    leader.start()
+    started.wait(5)
+
+    with pytest.raises(SingleFlightTimeout):
+        flight.do('code', lambda: None)
+
+    release.set()
+    leader.join(5)
+    assert flight.stats()['timeouts'] == 1
+
+
+def test_lookup_timeout_answers_503(make_app):
+    app = make_app(SHORT_URL_LOOKUP_TIMEOUT=0.05, SHORT_CODE_FILTER_ENABLED=False)
+    started, release = threading.Event(), threading.Event()
+    leader = threading.Thread(target=short_url_lookups.do,
+                              args=('abcde', blocking(lambda: None, started, release)))
+    leader.start()
+    started.wait(5)
+
+    try:
+        response = app.test_client().get('/abcde')
+    finally:
+        release.set()
+        leader.join(5)
+
+    assert response.status_code == 503
+    assert response.get_json() == {'error': "Lookup timed out, please try again"}
@@ -0,0 +1,60 @@
+import io
+import json
+import pytest
+from app.streaming import StreamError, iter_json_array, iter_ndjson
+
+
+def parse(text, chunk_size):
+    stream = io.BytesIO(text.encode('utf-8'))
+    return [item for item, _error in iter_json_array(stream, chunk_size=chunk_size)]
+
+
+@pytest.mark.parametrize('text', [
+    '[-15000000000.0]',
+    '[1.5e10, 2E-3, -0.25, 7]',
+    '[ 0 , 12 ,345]',
+    '[true, false, null]',
+    '["split \\"quoted\\" \\\\ \\u00e9 string", "a,b]c"]',
+    '[{"url": "https://example.com/ü", "body": "日本語 🔖"}, ["nested", [1]]]',
+    '[]',
+    '  [ ]  \n',
+])
+def test_elements_split_at_every_position(text):
+    expected = json.loads(text)
+
+    for chunk_size in range(1, len(text.encode('utf-8')) + 1):
+        assert parse(text, chunk_size) == expected
+
+
+@pytest.mark.parametrize('text', [
+    '[1,,2]',
+    '[,1]',
+    '[1 2]',
+    '[1,]',
+    '[1]garbage',
+    '[1]\n[2]',
+    '["a"x]',
+    '[1.]',
+    '[1',
+    '{"url": "https://example.com"}',
+    '',
+])
+def test_malformed_arrays_are_rejected(text):
+    for chunk_size in (1, 2, 3, 1024):
+        with pytest.raises(StreamError):
+            parse(text, chunk_size)
+
+
+def test_invalid_utf8_is_rejected():
+    with pytest.raises(StreamError):
+        list(iter_json_array(io.BytesIO(b'["\xff\xfe"]'), chunk_size=2))
+
+
+def test_ndjson_lines_split_across_chunks():
+    text = '{"url": "https://example.com/ü"}\n\nnot json\n{"url": "b"}'
+    stream = io.BytesIO(text.encode('utf-8'))
+
+    items = list(iter_ndjson(stream, chunk_size=3))
+
+    assert [item for item, _error in items] == [{'url': 'https://example.com/ü'}, None, {'url': 'b'}]
+    assert items[1][1] is not None
@@ -0,0 +1,88 @@
+from datetime import datetime
+import pytest
+from sqlalchemy.exc import OperationalError
+from app.database import db, Bookmark, HourlyVisits, User
+from app.visits import hour_of, visit_counter
+
+
+@pytest.fixture
+def bookmark(app):
+    user = User('alice', 'alice@example.com', 'secret')
+    db.session.add(user)
+    db.session.commit()
+    bookmark = Bookmark(url='https://example.com', body='', user_id=user.id)
+    db.session.add(bookmark)
+    db.session.commit()
+    return bookmark
+
+
+@pytest.fixture
+def failing_database(monkeypatch):
+    def write(batch):
+        raise OperationalError("UPDATE bookmarks", {}, Exception("database is down"))
+
+    monkeypatch.setattr(visit_counter, '_write', write)
+
+
+def stored_visits(bookmark_id):
+    db.session.expire_all()
+    visits = db.session.query(Bookmark.visits).filter(Bookmark.id == bookmark_id).scalar()
+    hourly = db.session.query(HourlyVisits.hour, HourlyVisits.visits).filter(
+        HourlyVisits.bookmark_id == bookmark_id).all()
+    return visits, hourly
+
+
+def test_redirects_update_visits_and_the_hourly_rollup(app, bookmark):
+    client = app.test_client()
+    before = hour_of(datetime.utcnow())
+
+    for _ in range(3):
+        assert client.get(f'/{bookmark.short_url}').status_code == 302
+
+    visits, hourly = stored_visits(bookmark.id)
+    assert visits == 3
+    # one row, unless the hour changed between the redirects
+    assert sum(visits for _hour, visits in hourly) == 3
+    assert {hour for hour, _visits in hourly} <= {before, hour_of(datetime.utcnow())}
+
+
+def test_flush_leaves_updated_at_unchanged(app, bookmark):
+    updated_at = datetime(2022, 5, 17, 8, 12, 31)
+    bookmark.updated_at = updated_at
+    db.session.commit()
+
+    visit_counter.record(bookmark.id, 2)
+
+    db.session.expire_all()
+    bookmark = db.session.get(Bookmark, bookmark.id)
+    assert bookmark.visits == 2
+    assert bookmark.updated_at == updated_at
+
+
+def test_failed_flush_puts_the_visits_back(app, bookmark, failing_database, monkeypatch):
+    visit_counter.record(bookmark.id, 2)
+    visit_counter.record(bookmark.id)
+
+    assert sum(visit_counter.pending().values()) == 3
+    assert stored_visits(bookmark.id) == (0, [])
+
+    monkeypatch.undo()
+    assert visit_counter.flush() == 3
+    assert visit_counter.pending() == {}
+    assert stored_visits(bookmark.id)[0] == 3
+
+
+def test_visits_are_dropped_after_repeated_failures(make_app, failing_database):
+    app = make_app(VISIT_FLUSH_MAX_FAILURES=3)
+    dropped = visit_counter.dropped
+
+    with app.app_context():
+        visit_counter.record(1)
+        visit_counter.record(1)
+        assert sum(visit_counter.pending().values()) == 2
+
+        visit_counter.record(1)
+
+        assert visit_counter.pending() == {}
+        assert visit_counter.dropped == dropped + 3
+        assert visit_counter.failures == 0